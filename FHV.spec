@@ -10,7 +10,9 @@ a = Analysis(
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
-    excludes=[],
+    # Unused standard library packages, left out so the onefile build has
+    # less to unpack before the first window
+    excludes=['unittest', 'doctest', 'pydoc', 'lib2to3', 'xmlrpc', 'idlelib', 'turtle', 'turtledemo'],
     noarchive=False,
     optimize=0,
 )
@@ -26,7 +28,8 @@ exe = EXE(
     debug=False,
     bootloader_ignore_signals=False,
     strip=False,
-    upx=True,
+    # UPX-compressed libraries are decompressed again on every start
+    upx=False,
     upx_exclude=[],
     runtime_tmpdir=None,
     console=False,
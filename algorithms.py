@@ -0,0 +1,135 @@
+"""Registry of the hash algorithms offered by File Hash Verifier
+
+Every algorithm is created through new_hash, so hashlib algorithms and
+optional third-party ones (BLAKE3, xxHash, CRC32C) are used the same way:
+an object with update(), digest() and hexdigest(). Optional algorithms
+are only listed when their package is installed.
+"""
+import hashlib
+import time
+
+try:
+    import blake3
+except ImportError:
+    blake3 = None
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+try:
+    import crc32c
+except ImportError:
+    crc32c = None
+
+# Security levels, shown next to the names in the dialogs
+CRYPTOGRAPHIC = "cryptographic"
+LEGACY = "legacy"  # Collisions are known; fine for corruption checks only
+CHECKSUM = "checksum"  # Not designed to resist tampering at all
+
+# Data hashed per algorithm by measure_throughput
+THROUGHPUT_SAMPLE = 4 * 1024 * 1024
+
+
+class Crc32cHash:
+    """hashlib-style wrapper around crc32c.crc32c"""
+
+    digest_size = 4
+
+    def __init__(self):
+        self.value = 0
+
+    def update(self, data):
+        self.value = crc32c.crc32c(data, self.value)
+
+    def digest(self):
+        return self.value.to_bytes(4, 'big')
+
+    def hexdigest(self):
+        return f"{self.value:08x}"
+
+
+class Algorithm:
+    """A registered hash algorithm"""
+
+    def __init__(self, name, label, factory, security=CRYPTOGRAPHIC):
+        self.name = name
+        self.label = label
+        self.factory = factory
+        self.security = security
+
+
+ALGORITHMS = {}
+# MB/s measured by measure_throughput, per algorithm name
+THROUGHPUT = {}
+
+
+def register(name, label, factory, security=CRYPTOGRAPHIC):
+    """Add an algorithm to the registry"""
+    ALGORITHMS[name] = Algorithm(name, label, factory, security)
+
+
+register("md5", "MD5", hashlib.md5, LEGACY)
+register("sha1", "SHA-1", hashlib.sha1, LEGACY)
+register("sha256", "SHA-256", hashlib.sha256)
+register("sha384", "SHA-384", hashlib.sha384)
+register("sha512", "SHA-512", hashlib.sha512)
+register("sha3_256", "SHA3-256", hashlib.sha3_256)
+register("sha3_512", "SHA3-512", hashlib.sha3_512)
+register("blake2b", "BLAKE2b", hashlib.blake2b)
+register("blake2s", "BLAKE2s", hashlib.blake2s)
+if blake3 is not None:
+    register("blake3", "BLAKE3", blake3.blake3)
+if xxhash is not None:
+    register("xxh3_64", "xxHash XXH3-64", xxhash.xxh3_64, CHECKSUM)
+    register("xxh3_128", "xxHash XXH3-128", xxhash.xxh3_128, CHECKSUM)
+if crc32c is not None:
+    register("crc32c", "CRC32C", Crc32cHash, CHECKSUM)
+
+
+def new_hash(name):
+    """Create a hash object for a registered or hashlib algorithm name
+
+    Raises ValueError for unknown names.
+    """
+    algorithm = ALGORITHMS.get(name)
+    if algorithm is not None:
+        return algorithm.factory()
+    return hashlib.new(name)
+
+
+def available_algorithms():
+    """Return the names of the registered algorithms"""
+    return list(ALGORITHMS)
+
+
+def measure_throughput(name, sample_size=THROUGHPUT_SAMPLE, repeat=2):
+    """Return how many MB/s an algorithm hashes from memory on this machine
+
+    The best of `repeat` runs over sample_size bytes is kept in THROUGHPUT,
+    so each algorithm is only measured once per process.
+    """
+    if name not in THROUGHPUT:
+        data = memoryview(bytes(sample_size))
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            hash_obj = new_hash(name)
+            hash_obj.update(data)
+            hash_obj.digest()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        THROUGHPUT[name] = sample_size / (1024 * 1024) / best if best else 0.0
+    return THROUGHPUT[name]
+
+
+def algorithm_label(name, with_throughput=True):
+    """Describe an algorithm for a dialog, with its security level and speed"""
+    algorithm = ALGORITHMS[name]
+    label = algorithm.label
+    if algorithm.security != CRYPTOGRAPHIC:
+        label += f" ({algorithm.security})"
+    if with_throughput:
+        label += f" - {measure_throughput(name):.0f} MB/s"
+    return label
@@ -0,0 +1,237 @@
+"""Hash the members of zip and tar archives without extracting them
+
+Checking what a release archive contains used to mean extracting it and
+hashing the extracted files, which writes every member to disk and reads
+it back. hash_archive streams each member from the archive into the hash
+objects instead:
+
+- zip members are compressed separately, so they are hashed in parallel,
+  each worker thread reading through its own handle on the archive;
+- tar archives (plain, .gz, .bz2 or .xz) are one compressed stream and are
+  read once from start to end; each chunk is hashed on a helper thread
+  while the next one is decompressed, as both release the GIL.
+
+Zip members are also checked against the CRC-32 stored in the archive.
+"""
+import lzma
+import os
+import posixpath
+import tarfile
+import threading
+import zipfile
+import zlib
+from collections import deque
+
+from file_copy import new_hashes, hex_digests, check_cancelled
+from hash_core import MAX_CHUNK_SIZE, default_workers
+from manifest import ManifestWriter, manifest_name, read_manifest, OK, FAILED, MISSING
+
+ZIP = "zip"
+TAR = "tar"
+
+# Size of the reads from members and from compressed tar streams
+ARCHIVE_CHUNK_SIZE = MAX_CHUNK_SIZE
+# Zip members queued per worker ahead of the one being reported
+PENDING_PER_WORKER = 4
+# Raised when a whole archive cannot be read, e.g. a truncated download
+ARCHIVE_ERRORS = (OSError, EOFError, tarfile.TarError, zipfile.BadZipFile)
+# Raised while reading one zip member: bad CRC, encrypted members, unsupported
+# compression methods and corrupt deflate, bzip2 (OSError, EOFError) or lzma data
+MEMBER_ERRORS = (OSError, EOFError, RuntimeError, NotImplementedError, zipfile.BadZipFile,
+                 zlib.error, lzma.LZMAError)
+
+
+def archive_format(path):
+    """Return ZIP or TAR for a supported archive, otherwise None"""
+    # Checked first: a tar header can appear to be valid at the start of a zip
+    if zipfile.is_zipfile(path):
+        return ZIP
+    try:
+        if tarfile.is_tarfile(path):
+            return TAR
+    except ARCHIVE_ERRORS:
+        pass
+    return None
+
+
+def member_name(name):
+    """Normalize a member name for manifests: '/' separators, no leading './'"""
+    name = posixpath.normpath(name.replace('\\', '/'))
+    return name[2:] if name.startswith('./') else name
+
+
+def hash_stream(f, hash_objs, progress=None, cancel_event=None, executor=None):
+    """Feed everything read from f to the hash objects
+
+    With an executor, each chunk is hashed there while the next one is read.
+    """
+    def update(chunk):
+        for hash_obj in hash_objs.values():
+            hash_obj.update(chunk)
+
+    pending = None
+    while True:
+        check_cancelled(cancel_event)
+        chunk = f.read(ARCHIVE_CHUNK_SIZE)
+        if pending is not None:
+            pending.result()
+            pending = None
+        if not chunk:
+            break
+        if executor is not None:
+            pending = executor.submit(update, chunk)
+        else:
+            update(chunk)
+        if progress is not None:
+            progress(len(chunk))
+
+
+def hash_tar(path, algorithm, progress=None, cancel_event=None):
+    """Yield (name, size, hash_value, error) for every file in a tar archive
+
+    A member that cannot be read is reported with its error. If the
+    archive cannot be read past it (the stream is truncated or corrupt),
+    the members behind it are not reported.
+    """
+    # Imported here: concurrent.futures would slow every startup
+    from concurrent.futures import ThreadPoolExecutor
+    # Stream mode ("r|*") never seeks, so the archive is decompressed once
+    with tarfile.open(path, "r|*", bufsize=ARCHIVE_CHUNK_SIZE) as tar, \
+            ThreadPoolExecutor(max_workers=1) as executor:
+        members = iter(tar)
+        # Set while the member before the next header could not be read
+        failed = False
+        while True:
+            try:
+                info = next(members, None)
+            except ARCHIVE_ERRORS:
+                if failed:
+                    # The stream broke inside the member already reported
+                    return
+                raise
+            failed = False
+            if info is None:
+                return
+            if not info.isfile():
+                continue
+            hash_objs = new_hashes(algorithm)
+            try:
+                hash_stream(tar.extractfile(info), hash_objs, progress, cancel_event, executor)
+            except ARCHIVE_ERRORS as e:
+                failed = True
+                yield member_name(info.name), info.size, None, e
+                continue
+            yield member_name(info.name), info.size, hex_digests(hash_objs, algorithm), None
+
+
+def hash_zip(path, algorithm, workers=None, progress=None, cancel_event=None):
+    """Yield (name, size, hash_value, error) for every file in a zip archive
+
+    Members are hashed on `workers` threads and reported in archive order.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    workers = workers or default_workers()
+    local = threading.local()
+    handles = []
+    lock = threading.Lock()
+
+    def hash_member(info):
+        archive = getattr(local, 'archive', None)
+        if archive is None:
+            # ZipFile objects are not safe to read from several threads
+            archive = local.archive = zipfile.ZipFile(path)
+            with lock:
+                handles.append(archive)
+        hash_objs = new_hashes(algorithm)
+        try:
+            with archive.open(info) as f:
+                hash_stream(f, hash_objs, progress, cancel_event)
+        except MEMBER_ERRORS as e:
+            return None, e
+        return hex_digests(hash_objs, algorithm), None
+
+    with zipfile.ZipFile(path) as archive:
+        # Sorted by position, so the workers read the archive front to back
+        members = sorted((info for info in archive.infolist() if not info.is_dir()),
+                         key=lambda info: info.header_offset)
+    pending = deque()
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            try:
+                for info in members:
+                    pending.append((info, executor.submit(hash_member, info)))
+                    if len(pending) < workers * PENDING_PER_WORKER:
+                        continue
+                    info, future = pending.popleft()
+                    yield (member_name(info.filename), info.file_size) + future.result()
+                while pending:
+                    info, future = pending.popleft()
+                    yield (member_name(info.filename), info.file_size) + future.result()
+            finally:
+                # Left early or failed: members not started yet are skipped
+                for _, future in pending:
+                    future.cancel()
+    finally:
+        for handle in handles:
+            handle.close()
+
+
+def hash_archive(path, algorithm, workers=None, progress=None, cancel_event=None):
+    """Yield (name, size, hash_value, error) for every file in an archive
+
+    Names are normalized with member_name. hash_value is a hex digest, or
+    a dict of digests when algorithm is a list; error is set instead when
+    a member could not be read. Raises ValueError for files that are not
+    zip or tar archives.
+    """
+    kind = archive_format(path)
+    if kind == ZIP:
+        return hash_zip(path, algorithm, workers, progress, cancel_event)
+    if kind == TAR:
+        return hash_tar(path, algorithm, progress, cancel_event)
+    raise ValueError(f"{path} is not a zip or tar archive")
+
+
+def archive_size(path):
+    """Return the uncompressed size of a zip archive's files, or 0 if unknown"""
+    if archive_format(path) != ZIP:
+        # Only reading a compressed tar to its end tells its size
+        return 0
+    with zipfile.ZipFile(path) as archive:
+        return sum(info.file_size for info in archive.infolist() if not info.is_dir())
+
+
+def archive_manifest_writer(path, algorithms):
+    """Open ARCHIVE.SHA256SUMS style manifests next to an archive
+
+    Names are the member names, so the manifests can be checked with
+    verify_manifest after extracting the archive in its own folder.
+    """
+    base_name = os.path.basename(path)
+    return ManifestWriter(os.path.dirname(os.path.abspath(path)), algorithms,
+                          {algorithm: f"{base_name}.{manifest_name(algorithm)}" for algorithm in algorithms})
+
+
+def verify_archive(path, manifest_path, algorithm=None, workers=None, progress=None,
+                   cancel_event=None, errors=None):
+    """Check the members of an archive against a checksum manifest
+
+    Yields (entry, status, actual_hash, error) in manifest order, with the
+    statuses of verify_manifest; MISSING means the archive has no such
+    member. Members not listed in the manifest are ignored.
+    """
+    entries = list(read_manifest(manifest_path, algorithm, errors))
+    algorithms = sorted({entry.algorithm for entry in entries})
+    if not algorithms:
+        return
+    hash_algorithm = algorithms[0] if len(algorithms) == 1 else algorithms
+    found = {}
+    for name, size, hash_value, error in hash_archive(path, hash_algorithm, workers, progress, cancel_event):
+        found[name] = (hash_value, error)
+    for entry in entries:
+        hash_value, error = found.get(member_name(entry.name), (None, None))
+        if hash_value is None:
+            yield entry, MISSING if error is None else FAILED, None, error
+            continue
+        actual = hash_value[entry.algorithm] if isinstance(hash_value, dict) else hash_value
+        yield entry, OK if actual.lower() == entry.expected else FAILED, actual, None
@@ -0,0 +1,139 @@
+"""Baseline snapshots of a directory tree
+
+A baseline records the size, modification time and digest of every file
+under a folder. Checking a folder against its baseline only hashes the
+files whose size or modification time changed, so a nightly sweep of a
+large tree reads just the files that were touched since the last one.
+"""
+import json
+import os
+from datetime import datetime
+
+from file_scanner import scan_tree
+from hash_engine import HashEngine
+
+BASELINE_VERSION = 1
+
+# Statuses reported by check_baseline
+ADDED = "added"
+REMOVED = "removed"
+MODIFIED = "modified"
+UNCHANGED = "unchanged"
+
+
+def relative_name(path, root):
+    """Return a path relative to root with '/' separators"""
+    return os.path.relpath(path, root).replace(os.sep, '/')
+
+
+def new_baseline(root, algorithm, scan_options=None):
+    """Return an empty baseline dict for a folder
+
+    scan_options (keyword arguments of file_scanner.scan_tree) are kept so
+    later checks walk the folder the same way.
+    """
+    return {
+        'version': BASELINE_VERSION,
+        'root': os.path.abspath(root),
+        'algorithm': algorithm,
+        'scan': scan_options or {},
+        'created': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        'files': {}
+    }
+
+
+def load_baseline(file_path):
+    """Read a baseline saved with save_baseline"""
+    with open(file_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    if baseline.get('version') != BASELINE_VERSION or 'files' not in baseline:
+        raise ValueError(f"{file_path} is not a baseline file")
+    return baseline
+
+
+def save_baseline(baseline, file_path):
+    """Write a baseline as JSON, replacing the old file only once complete"""
+    temp_path = file_path + ".tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(baseline, f, separators=(',', ':'))
+    os.replace(temp_path, file_path)
+
+
+def create_baseline(root, algorithm="sha256", engine=None, errors=None, **scan_options):
+    """Hash every file under root and return a new baseline
+
+    scan_options are passed to file_scanner.scan_tree. Files that cannot be
+    hashed are reported in errors (if given) and left out.
+    """
+    baseline = new_baseline(root, algorithm, scan_options)
+    for status, name, entry, error in check_baseline(baseline, engine, errors=errors):
+        if error is not None and errors is not None:
+            errors.append(f"{name}: {error}")
+    return baseline
+
+
+def check_baseline(baseline, engine=None, rehash=False, errors=None):
+    """Compare the folder of a baseline with the baseline, updating it
+
+    Yields (status, name, entry, error) tuples, where status is ADDED,
+    REMOVED, MODIFIED or UNCHANGED and entry is the file's new baseline
+    entry (None for removed files and files that could not be hashed).
+    Files whose size and modification time match the baseline are
+    reported UNCHANGED without being read unless rehash is true, which
+    also catches content changed behind an unchanged timestamp.
+
+    baseline['files'] is updated in place, so saving the baseline afterwards
+    records the current state of the folder.
+    """
+    engine = engine or HashEngine()
+    root = baseline['root']
+    files = baseline['files']
+    seen = set()
+    to_hash = []
+
+    on_error = None if errors is None else (lambda e: errors.append(str(e)))
+    for path in scan_tree(root, on_error=on_error, **baseline.get('scan', {})):
+        name = relative_name(path, root)
+        seen.add(name)
+        try:
+            st = os.stat(path)
+        except OSError as e:
+            yield MODIFIED if name in files else ADDED, name, None, str(e)
+            continue
+        old = files.get(name)
+        if (not rehash and old is not None and old['size'] == st.st_size
+                and old['mtime_ns'] == st.st_mtime_ns):
+            yield UNCHANGED, name, old, None
+            continue
+        to_hash.append((name, st))
+
+    yield from update_entries(baseline, to_hash, engine)
+
+    for name in [name for name in files if name not in seen]:
+        del files[name]
+        yield REMOVED, name, None, None
+
+
+def update_entries(baseline, to_hash, engine):
+    """Hash (name, stat) items of a baseline's folder and record them
+
+    Yields (status, name, entry, error) tuples like check_baseline; a file
+    whose digest did not change is UNCHANGED. Used by check_baseline and
+    by watcher.FolderWatcher for the files it saw change.
+    """
+    root = baseline['root']
+    algorithm = baseline['algorithm']
+    files = baseline['files']
+    for index, path, hash_value, error in engine.hash_files(
+            (os.path.join(root, name) for name, _ in to_hash), algorithm):
+        name, st = to_hash[index]
+        old = files.get(name)
+        status = ADDED if old is None else MODIFIED
+        if hash_value is None:
+            yield status, name, None, error
+            continue
+        entry = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'hash': hash_value}
+        files[name] = entry
+        if old is not None and old['hash'] == hash_value:
+            status = UNCHANGED
+        yield status, name, entry, None
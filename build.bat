@@ -134,7 +134,11 @@ if exist "FileHashVerifier.spec" del /f /q "FileHashVerifier.spec" >> "%LOG_FILE
 
 call :log "Running PyInstaller..."
 REM Build the executable with additional options to reduce false positives
-pyinstaller --noconfirm --onefile --windowed --icon=NONE --name "FHV" ^
+REM --noupx and the excluded modules keep start-up fast, see FHV.spec
+pyinstaller --noconfirm --onefile --windowed --noupx --icon=NONE --name "FHV" ^
+    --exclude-module unittest --exclude-module doctest --exclude-module pydoc ^
+    --exclude-module lib2to3 --exclude-module xmlrpc --exclude-module idlelib ^
+    --exclude-module turtle --exclude-module turtledemo ^
     --add-data "README.md;." ^
     --add-data "BUILD_INSTRUCTIONS.md;." ^
     --add-data "help.html;." ^
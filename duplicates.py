@@ -0,0 +1,131 @@
+"""Find duplicate files without hashing every file
+
+Candidates are narrowed in three passes: files are grouped by size (a file
+with a unique size cannot have a duplicate and is never read), then by a
+hash of their first and last blocks, and only files that still collide are
+hashed in full with HashEngine.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from algorithms import new_hash
+from hash_engine import HashEngine
+from file_compare import read_samples
+
+# Bytes read at each end of a file for the partial hash
+PARTIAL_SIZE = 64 * 1024
+# Files given to the partial hash pool at a time
+PARTIAL_BLOCK = 1024
+
+
+class DuplicateGroup:
+    """Files with the same size and digest"""
+
+    def __init__(self, size, hash_value, paths):
+        self.size = size
+        self.hash_value = hash_value
+        self.paths = paths
+
+    @property
+    def reclaimable(self):
+        """Bytes freed by keeping a single copy"""
+        return self.size * (len(self.paths) - 1)
+
+
+def group_by_size(paths, min_size=1, errors=None):
+    """Return {size: [path, ...]} for the sizes shared by two or more files
+
+    Hard links to a file already seen are dropped since they use no extra
+    space. Only the first path of each size is kept until a second one
+    turns up, so unique files cost one dict entry each.
+    """
+    first = {}
+    shared = {}
+    inodes = set()
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except OSError as e:
+            if errors is not None:
+                errors.append(f"{path}: {e}")
+            continue
+        if st.st_size < min_size:
+            continue
+        if st.st_nlink > 1:
+            key = (st.st_dev, st.st_ino)
+            if key in inodes:
+                continue
+            inodes.add(key)
+        size = st.st_size
+        if size in shared:
+            shared[size].append(path)
+        elif size in first:
+            shared[size] = [first.pop(size), path]
+        else:
+            first[size] = path
+    return shared
+
+
+def partial_digest(path, size, algorithm="sha256", sample_size=PARTIAL_SIZE):
+    """Hash the first and last sample_size bytes of a file"""
+    hash_obj = new_hash(algorithm)
+    for block in read_samples(path, size, sample_size):
+        hash_obj.update(block)
+    return hash_obj.hexdigest()
+
+
+def find_duplicates(paths, algorithm="sha256", engine=None, sample_size=PARTIAL_SIZE,
+                    min_size=1, errors=None):
+    """Return the groups of identical files among paths
+
+    paths may be any iterable, such as file_scanner.scan_tree. Files no
+    larger than two samples are fully covered by the partial hash and are
+    not read again. Groups are sorted by reclaimable bytes, largest first.
+    Unreadable files are reported in errors (if given) and left out.
+    """
+    engine = engine or HashEngine()
+    by_size = group_by_size(paths, min_size, errors)
+
+    # Partial hash of the first and last blocks
+    candidates = [(size, path) for size, group in by_size.items() for path in group]
+    del by_size
+    by_partial = {}
+    with ThreadPoolExecutor(max_workers=engine.workers) as executor:
+        for start in range(0, len(candidates), PARTIAL_BLOCK):
+            engine.check_cancelled()
+            block = candidates[start:start + PARTIAL_BLOCK]
+            futures = [executor.submit(partial_digest, path, size, algorithm, sample_size)
+                       for size, path in block]
+            for (size, path), future in zip(block, futures):
+                try:
+                    by_partial.setdefault((size, future.result()), []).append(path)
+                except OSError as e:
+                    if errors is not None:
+                        errors.append(f"{path}: {e}")
+    del candidates
+
+    groups = []
+    to_hash = []
+    for (size, digest), group in by_partial.items():
+        if len(group) < 2:
+            continue
+        if size <= 2 * sample_size:
+            groups.append(DuplicateGroup(size, digest, sorted(group)))
+        else:
+            to_hash.extend((size, path) for path in group)
+    del by_partial
+
+    # Full hash of the files that still collide
+    by_hash = {}
+    for index, path, hash_value, error in engine.hash_files((path for _, path in to_hash), algorithm):
+        if hash_value is None:
+            if errors is not None:
+                errors.append(f"{path}: {error}")
+            continue
+        by_hash.setdefault((to_hash[index][0], hash_value), []).append(path)
+    for (size, hash_value), group in by_hash.items():
+        if len(group) > 1:
+            groups.append(DuplicateGroup(size, hash_value, sorted(group)))
+
+    groups.sort(key=lambda group: group.reclaimable, reverse=True)
+    return groups
@@ -0,0 +1,226 @@
+"""Copy a file and verify the copy in one and a half passes
+
+Copying an artifact and then comparing source and destination reads the
+source twice and the destination once. copy_and_verify reads the source
+once, writing each chunk to the destination and feeding the same buffer to
+the hash objects, then optionally reads the destination back past the page
+cache, so the check sees what reached the disk rather than what is still
+in memory.
+"""
+import mmap
+import os
+import shutil
+import sys
+
+from algorithms import new_hash
+from hash_core import HashCancelled, choose_chunk_size, advise_sequential, iter_chunks
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# The copy is written under this suffix and renamed once complete
+COPY_SUFFIX = ".part"
+# Read size of the uncached re-read; a multiple of any device block size
+DIRECT_CHUNK_SIZE = 1024 * 1024
+
+# How the destination was re-read
+VERIFY_DIRECT = "direct I/O"
+VERIFY_NOCACHE = "uncached read"
+VERIFY_DROPPED = "page cache dropped"
+VERIFY_CACHED = "cached read"
+
+
+class CopyResult:
+    """Outcome of copy_and_verify
+
+    hash_value is the digest of the bytes read from the source (a dict for
+    several algorithms). verify_hash is the digest of the destination read
+    back, or None when it was not re-read; verify_method says how it was
+    read.
+    """
+
+    def __init__(self, source, destination, size, hash_value, verify_hash=None, verify_method=None):
+        self.source = source
+        self.destination = destination
+        self.size = size
+        self.hash_value = hash_value
+        self.verify_hash = verify_hash
+        self.verify_method = verify_method
+
+    @property
+    def verified(self):
+        """True or False once the copy was re-read, otherwise None"""
+        if self.verify_hash is None:
+            return None
+        return self.verify_hash == self.hash_value
+
+
+def new_hashes(algorithm):
+    """Return {name: hash object} for an algorithm name or a list of names"""
+    if isinstance(algorithm, str) and algorithm.startswith("tree-"):
+        raise ValueError("tree algorithms cannot be calculated while copying")
+    names = list(algorithm) if isinstance(algorithm, (list, tuple)) else [algorithm]
+    return {name: new_hash(name) for name in names}
+
+
+def hex_digests(hash_objs, algorithm):
+    """Return the digest in compute_digest's form: a string or a dict"""
+    if isinstance(algorithm, (list, tuple)):
+        return {name: h.hexdigest() for name, h in hash_objs.items()}
+    return hash_objs[algorithm].hexdigest()
+
+
+def check_cancelled(cancel_event):
+    """Raise HashCancelled if the cancel event is set"""
+    if cancel_event is not None and cancel_event.is_set():
+        raise HashCancelled()
+
+
+def copy_with_hash(source, destination, algorithm, chunk_size=None, progress=None, cancel_event=None):
+    """Copy source to destination, hashing the bytes on their way through
+
+    Each chunk is hashed on a helper thread while it is written, since
+    both release the GIL. The copy is written to destination + COPY_SUFFIX,
+    flushed to disk, given the source's permissions and times and then
+    renamed, so an interrupted copy never leaves a partial destination.
+    Returns the digest as compute_digest would.
+    """
+    # Imported here: concurrent.futures would slow every startup
+    from concurrent.futures import ThreadPoolExecutor
+    hash_objs = new_hashes(algorithm)
+    if os.path.exists(destination) and os.path.samefile(source, destination):
+        raise ValueError("the destination is the source file")
+    temp_path = destination + COPY_SUFFIX
+
+    def update(chunk):
+        for hash_obj in hash_objs.values():
+            hash_obj.update(chunk)
+
+    with open(source, 'rb', buffering=0) as src:
+        st = os.fstat(src.fileno())
+        if not chunk_size:
+            chunk_size = choose_chunk_size(st.st_size, getattr(st, 'st_blksize', None))
+        advise_sequential(src)
+        try:
+            with open(temp_path, 'wb') as dst, ThreadPoolExecutor(max_workers=1) as executor:
+                for chunk in iter_chunks(src, chunk_size):
+                    check_cancelled(cancel_event)
+                    hashed = executor.submit(update, chunk)
+                    dst.write(chunk)
+                    # The buffer is refilled by the next read
+                    hashed.result()
+                    if progress is not None:
+                        progress(len(chunk))
+                dst.flush()
+                os.fsync(dst.fileno())
+            shutil.copystat(source, temp_path)
+            os.replace(temp_path, destination)
+        except BaseException:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+    return hex_digests(hash_objs, algorithm)
+
+
+def open_direct(path):
+    """Open a file for O_DIRECT reads, or return None where not supported"""
+    if not hasattr(os, 'O_DIRECT'):
+        return None
+    try:
+        fd = os.open(path, os.O_RDONLY | os.O_DIRECT)
+    except OSError:
+        # E.g. tmpfs and some network filesystems refuse O_DIRECT
+        return None
+    return open(fd, 'rb', buffering=0)
+
+
+def read_direct(f, hash_objs, progress=None, cancel_event=None):
+    """Hash an O_DIRECT file through a page-aligned buffer"""
+    # Anonymous mappings are page aligned, as O_DIRECT requires
+    with mmap.mmap(-1, DIRECT_CHUNK_SIZE) as buffer:
+        view = memoryview(buffer)
+        try:
+            while True:
+                check_cancelled(cancel_event)
+                size = f.readinto(buffer)
+                if not size:
+                    break
+                for hash_obj in hash_objs.values():
+                    hash_obj.update(view[:size])
+                if progress is not None:
+                    progress(size)
+        finally:
+            view.release()
+
+
+def read_uncached(path, algorithm, progress=None, cancel_event=None):
+    """Hash a file while bypassing the page cache as far as the OS allows
+
+    Returns (digest, method). Linux reads with O_DIRECT; where the
+    filesystem refuses it, the file's cached pages are dropped first with
+    posix_fadvise, which works for pages already written back (the copy
+    is fsync'ed). macOS uses F_NOCACHE. Elsewhere the read may be served
+    from the cache, and the method says so.
+    """
+    hash_objs = new_hashes(algorithm)
+    f = open_direct(path)
+    if f is not None:
+        counted = 0
+
+        def direct_progress(count):
+            nonlocal counted
+            counted += count
+            if progress is not None:
+                progress(count)
+
+        try:
+            with f:
+                read_direct(f, hash_objs, direct_progress, cancel_event)
+            return hex_digests(hash_objs, algorithm), VERIFY_DIRECT
+        except OSError:
+            # Refused at a read instead of at open; start over, taking back
+            # the bytes already reported
+            hash_objs = new_hashes(algorithm)
+            if progress is not None and counted:
+                progress(-counted)
+
+    with open(path, 'rb', buffering=0) as f:
+        st = os.fstat(f.fileno())
+        method = VERIFY_CACHED
+        if sys.platform == "darwin" and fcntl is not None and hasattr(fcntl, 'F_NOCACHE'):
+            fcntl.fcntl(f.fileno(), fcntl.F_NOCACHE, 1)
+            method = VERIFY_NOCACHE
+        elif hasattr(os, 'posix_fadvise'):
+            try:
+                os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+                method = VERIFY_DROPPED
+            except OSError:
+                pass
+        for chunk in iter_chunks(f, choose_chunk_size(st.st_size, getattr(st, 'st_blksize', None))):
+            check_cancelled(cancel_event)
+            for hash_obj in hash_objs.values():
+                hash_obj.update(chunk)
+            if progress is not None:
+                progress(len(chunk))
+    return hex_digests(hash_objs, algorithm), method
+
+
+def copy_and_verify(source, destination, algorithm, verify=True, progress=None, cancel_event=None):
+    """Copy a file, hashing it in flight, and optionally re-read the copy
+
+    A directory destination receives the file under its own name. Returns
+    a CopyResult. progress is called with byte counts of both passes.
+    """
+    if os.path.isdir(destination):
+        destination = os.path.join(destination, os.path.basename(source))
+    hash_value = copy_with_hash(source, destination, algorithm, progress=progress,
+                                cancel_event=cancel_event)
+    size = os.path.getsize(destination)
+    if not verify:
+        return CopyResult(source, destination, size, hash_value)
+    verify_hash, method = read_uncached(destination, algorithm, progress, cancel_event)
+    return CopyResult(source, destination, size, hash_value, verify_hash, method)
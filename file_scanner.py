@@ -0,0 +1,119 @@
+import fnmatch
+import os
+import stat
+
+# What to do with symbolic links found while scanning
+SYMLINK_POLICIES = ("skip", "files", "follow")
+
+
+def is_hidden(entry):
+    """Return True for dot files and files with the Windows hidden attribute"""
+    if entry.name.startswith('.'):
+        return True
+    try:
+        attributes = getattr(entry.stat(follow_symlinks=False), 'st_file_attributes', 0)
+    except OSError:
+        return False
+    return bool(attributes & getattr(stat, 'FILE_ATTRIBUTE_HIDDEN', 0))
+
+
+def split_patterns(text):
+    """Split a ';' or ',' separated list of glob patterns"""
+    if not text:
+        return []
+    return [p.strip() for p in text.replace(',', ';').split(';') if p.strip()]
+
+
+def matches(patterns, name, rel_path):
+    """Return True if a glob matches the file name or its relative path"""
+    rel_path = rel_path.replace(os.sep, '/')
+    return any(fnmatch.fnmatch(name, p) or fnmatch.fnmatch(rel_path, p) for p in patterns)
+
+
+def scan_tree(root, include=None, exclude=None, symlinks="skip", include_hidden=False,
+              max_depth=None, on_error=None):
+    """Yield the paths of the files under root as they are discovered
+
+    The tree is walked depth-first with os.scandir, holding one open
+    directory iterator per level, so memory use does not depend on the size
+    of the tree and the caller can start on the first file right away.
+
+    include and exclude are lists of glob patterns matched against the file
+    name and the path relative to root; exclude also prunes directories.
+    symlinks is one of SYMLINK_POLICIES: "skip" ignores links, "files" follows
+    links to files only, "follow" also descends into linked directories
+    (each directory is visited once, so link loops are harmless).
+    max_depth limits how many directory levels below root are entered, with
+    0 meaning root only. on_error is called with each OSError; by default
+    unreadable directories are skipped silently.
+    """
+    if symlinks not in SYMLINK_POLICIES:
+        raise ValueError(f"Unknown symlink policy: {symlinks}")
+    include = include or []
+    exclude = exclude or []
+    visited = set()
+
+    def open_dir(path):
+        try:
+            if symlinks == "follow":
+                st = os.stat(path)
+                key = (st.st_dev, st.st_ino)
+                if key in visited:
+                    return None
+                visited.add(key)
+            return os.scandir(path)
+        except OSError as e:
+            if on_error is not None:
+                on_error(e)
+            return None
+
+    root_iter = open_dir(root)
+    if root_iter is None:
+        return
+    stack = [(root_iter, 0)]
+    try:
+        while stack:
+            iterator, depth = stack[-1]
+            try:
+                entry = next(iterator)
+            except StopIteration:
+                iterator.close()
+                stack.pop()
+                continue
+            except OSError as e:
+                if on_error is not None:
+                    on_error(e)
+                iterator.close()
+                stack.pop()
+                continue
+
+            if not include_hidden and is_hidden(entry):
+                continue
+            rel_path = os.path.relpath(entry.path, root)
+            if exclude and matches(exclude, entry.name, rel_path):
+                continue
+
+            try:
+                is_link = entry.is_symlink()
+                if is_link and symlinks == "skip":
+                    continue
+                follow = not is_link or symlinks == "follow"
+                if entry.is_dir(follow_symlinks=follow):
+                    if max_depth is None or depth < max_depth:
+                        sub_iter = open_dir(entry.path)
+                        if sub_iter is not None:
+                            stack.append((sub_iter, depth + 1))
+                    continue
+                if not entry.is_file(follow_symlinks=True):
+                    continue
+            except OSError as e:
+                if on_error is not None:
+                    on_error(e)
+                continue
+
+            if include and not matches(include, entry.name, rel_path):
+                continue
+            yield entry.path
+    finally:
+        for iterator, _ in stack:
+            iterator.close()
@@ -0,0 +1,545 @@
+"""Hashing benchmarks
+
+Run from the command line to see how fast this machine hashes with each
+read size:
+
+    python hash_bench.py chunks [file] [--algorithm sha256] [--size-mb 256]
+
+Without a file a temporary file of --size-mb megabytes is created.
+
+The suite measures every algorithm, read strategy, chunk size and level of
+parallelism of the single-file and batch paths on synthetic files, with
+cold and warm page cache, and saves the results as JSON:
+
+    python hash_bench.py suite [--dir DIR] [--output results.json] [--quick]
+    python hash_bench.py compare old.json new.json [--threshold 10]
+
+The start-up benchmark times, in fresh interpreters, importing the CLI and
+the GUI modules and launching the application until its window is drawn.
+Its results can be compared the same way:
+
+    python hash_bench.py startup [--runs 5] [--output startup.json]
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows; peak RSS is then not reported
+    resource = None
+
+from algorithms import new_hash, available_algorithms
+from hash_core import iter_chunks, advise_sequential, choose_chunk_size, compute_digest
+from hash_engine import HashEngine, BACKENDS
+from tree_hash import tree_hash
+
+# Folder of the application, where the start-up benchmark runs it
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+# Makes the GUI exit once its window is drawn (see file_hash_verifier.main)
+STARTUP_BENCHMARK_ENV = "FHV_STARTUP_BENCHMARK"
+# Seconds the GUI is given to draw its window
+STARTUP_TIMEOUT = 60
+
+# Read sizes compared by the chunk size benchmark
+CHUNK_SIZES = [4 * 1024, 16 * 1024, 64 * 1024, 256 * 1024,
+               1024 * 1024, 4 * 1024 * 1024, 16 * 1024 * 1024]
+
+
+def make_test_file(size, directory=None):
+    """Create a temporary file of random data and return its path"""
+    fd, path = tempfile.mkstemp(prefix="fhv_bench_", dir=directory)
+    block = os.urandom(1024 * 1024)
+    with os.fdopen(fd, 'wb') as f:
+        remaining = size
+        while remaining > 0:
+            f.write(block[:min(remaining, len(block))])
+            remaining -= len(block)
+    return path
+
+
+def time_chunk_size(file_path, algorithm, chunk_size):
+    """Hash a file with readinto and one read size, return seconds taken"""
+    hash_obj = new_hash(algorithm)
+    start = time.perf_counter()
+    with open(file_path, 'rb', buffering=0) as f:
+        advise_sequential(f)
+        for chunk in iter_chunks(f, chunk_size):
+            hash_obj.update(chunk)
+    hash_obj.hexdigest()
+    return time.perf_counter() - start
+
+
+def time_read_loop(file_path, algorithm, chunk_size=4096):
+    """Hash a file with the old f.read() loop, return seconds taken"""
+    hash_obj = new_hash(algorithm)
+    start = time.perf_counter()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            hash_obj.update(chunk)
+    hash_obj.hexdigest()
+    return time.perf_counter() - start
+
+
+def chunk_size_benchmark(file_path, algorithm="sha256", chunk_sizes=CHUNK_SIZES, repeat=3):
+    """Measure MB/s for each read size on a file
+
+    Returns a list of (label, chunk_size, mb_per_second) rows. The best of
+    `repeat` runs is used, so the file is mostly served from the page cache.
+    """
+    size_mb = os.path.getsize(file_path) / (1024 * 1024)
+    rows = []
+    best = min(time_read_loop(file_path, algorithm) for _ in range(repeat))
+    rows.append(("read(4096) loop", 4096, size_mb / best if best else 0.0))
+    for chunk_size in chunk_sizes:
+        best = min(time_chunk_size(file_path, algorithm, chunk_size) for _ in range(repeat))
+        rows.append(("readinto", chunk_size, size_mb / best if best else 0.0))
+    st = os.stat(file_path)
+    auto = choose_chunk_size(st.st_size, getattr(st, 'st_blksize', None))
+    best = min(time_chunk_size(file_path, algorithm, auto) for _ in range(repeat))
+    rows.append(("readinto (auto)", auto, size_mb / best if best else 0.0))
+    return rows
+
+
+# Synthetic data set of the suite: many small files and a few huge ones
+SMALL_FILES = 2000
+SMALL_FILE_SIZE = 16 * 1024
+LARGE_FILES = 2
+LARGE_FILE_SIZE = 256 * 1024 * 1024
+# Read strategies compared by the suite
+READ_STRATEGIES = ("read", "readinto", "mmap")
+# Result fields that must match for two runs to be compared
+RESULT_KEY = ("group", "algorithm", "read_mode", "chunk_size", "backend", "workers", "cache")
+
+
+def make_dataset(directory, small_files=SMALL_FILES, small_size=SMALL_FILE_SIZE,
+                 large_files=LARGE_FILES, large_size=LARGE_FILE_SIZE):
+    """Create the suite's files under directory, return (small, large) path lists"""
+    small_dir = os.path.join(directory, "small")
+    os.makedirs(small_dir, exist_ok=True)
+    block = os.urandom(small_size)
+    small = []
+    for i in range(small_files):
+        path = os.path.join(small_dir, f"{i:06d}.bin")
+        with open(path, 'wb') as f:
+            # Vary the content so no two files are alike
+            f.write(i.to_bytes(8, 'little') + block[8:])
+        small.append(path)
+    large = [make_test_file(large_size, directory) for _ in range(large_files)]
+    return small, large
+
+
+def drop_page_cache(paths):
+    """Ask the OS to evict files from the page cache
+
+    Returns False where this is not supported, so cold runs are skipped.
+    """
+    if not hasattr(os, 'posix_fadvise'):
+        return False
+    for path in paths:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+    return True
+
+
+def reset_peak_rss():
+    """Reset the peak RSS counter where the OS allows it (Linux)"""
+    try:
+        with open("/proc/self/clear_refs", 'w') as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def peak_rss():
+    """Return the peak resident set size in bytes, or None if unknown"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return usage if sys.platform == "darwin" else usage * 1024
+
+
+def cpu_seconds():
+    """Return CPU time used by this process and its finished children"""
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+def measure(run, paths, cache, **fields):
+    """Time run() over paths and return a result dict
+
+    cache is "cold" (files evicted from the page cache first) or "warm"
+    (files read once before timing). Returns None for cold runs where the
+    page cache cannot be dropped.
+    """
+    if cache == "cold":
+        if not drop_page_cache(paths):
+            return None
+    else:
+        for path in paths:
+            with open(path, 'rb', buffering=0) as f:
+                for _ in iter_chunks(f, 1024 * 1024):
+                    pass
+    total = sum(os.path.getsize(path) for path in paths)
+    reset_peak_rss()
+    cpu_start = cpu_seconds()
+    start = time.perf_counter()
+    run()
+    seconds = time.perf_counter() - start
+    cpu = cpu_seconds() - cpu_start
+    result = dict.fromkeys(RESULT_KEY)
+    result.update(fields)
+    result.update({
+        'cache': cache,
+        'bytes': total,
+        'files': len(paths),
+        'seconds': round(seconds, 4),
+        'mb_per_second': round(total / (1024 * 1024) / seconds, 1) if seconds else 0.0,
+        'files_per_second': round(len(paths) / seconds, 1) if seconds else 0.0,
+        'cpu_percent': round(100 * cpu / seconds, 1) if seconds else 0.0,
+        'peak_rss': peak_rss()
+    })
+    return result
+
+
+def hash_with(path, algorithm, read_mode, chunk_size=None):
+    """Hash a file with one of READ_STRATEGIES"""
+    if read_mode == "read":
+        hash_obj = new_hash(algorithm)
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size or 4096), b''):
+                hash_obj.update(chunk)
+        return hash_obj.hexdigest()
+    return compute_digest(path, algorithm, "mmap" if read_mode == "mmap" else "buffered")
+
+
+def worker_levels(limit=None):
+    """Return 1, 2, 4, ... up to the number of cores"""
+    cores = limit or os.cpu_count() or 1
+    levels = [1]
+    while levels[-1] * 2 < cores:
+        levels.append(levels[-1] * 2)
+    if cores > 1:
+        levels.append(cores)
+    return levels
+
+
+def run_suite(small, large, algorithms=None, algorithm="sha256", chunk_sizes=CHUNK_SIZES,
+              caches=("cold", "warm"), report=None):
+    """Run every benchmark of the suite and return the list of result dicts
+
+    Single file: each algorithm, each read strategy, each chunk size and tree
+    hashing with 1..N threads, on the large files. Batch: HashEngine with
+    each backend and 1..N workers on the small files. report is called with
+    each result as it is produced.
+    """
+    algorithms = algorithms or available_algorithms()
+    runs = []
+
+    def add(run, paths, **fields):
+        for cache in caches:
+            result = measure(run, paths, cache, **fields)
+            if result is not None:
+                runs.append(result)
+                if report is not None:
+                    report(result)
+
+    for name in algorithms:
+        add(lambda: [hash_with(p, name, "readinto") for p in large], large,
+            group="algorithm", algorithm=name, read_mode="readinto")
+    for read_mode in READ_STRATEGIES:
+        add(lambda: [hash_with(p, algorithm, read_mode) for p in large], large,
+            group="read strategy", algorithm=algorithm, read_mode=read_mode)
+    for chunk_size in chunk_sizes:
+        add(lambda: [time_chunk_size(p, algorithm, chunk_size) for p in large], large,
+            group="chunk size", algorithm=algorithm, read_mode="readinto", chunk_size=chunk_size)
+    for workers in worker_levels():
+        add(lambda: [tree_hash(p, algorithm, workers=workers) for p in large], large,
+            group="tree", algorithm="tree-" + algorithm, read_mode="readinto", workers=workers)
+    for backend in BACKENDS:
+        for workers in worker_levels():
+            add(lambda: HashEngine(backend, workers).hash_all(small, algorithm), small,
+                group="batch", algorithm=algorithm, read_mode="buffered",
+                backend=backend, workers=workers)
+    return runs
+
+
+def describe(result):
+    """One line summary of a suite result"""
+    parts = [result['group'], result['algorithm']]
+    if result['group'] == "read strategy":
+        parts.append(result['read_mode'])
+    if result['chunk_size']:
+        parts.append(format_size(result['chunk_size']))
+    if result['backend']:
+        parts.append(result['backend'])
+    if result['workers']:
+        parts.append(f"{result['workers']} workers")
+    parts.append(result['cache'])
+    return " / ".join(parts)
+
+
+def format_result(result):
+    """Format a suite result as a table row"""
+    rss = result['peak_rss']
+    return (f"  {describe(result):<48} {result['mb_per_second']:9.1f} MB/s "
+            f"{result['files_per_second']:9.1f} files/s {result['cpu_percent']:6.1f}% CPU "
+            f"{f'{rss / (1024 * 1024):.0f} MiB' if rss else 'n/a':>8} RSS")
+
+
+def save_results(runs, file_path, parameters):
+    """Write suite results as JSON with a description of the machine"""
+    with open(file_path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'date': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'parameters': parameters,
+            'results': runs
+        }, f, indent=2)
+
+
+def compare_results(old, new, threshold=10.0):
+    """Return (description, old MB/s, new MB/s, change %) rows for matching runs
+
+    Runs are matched on RESULT_KEY; the change is flagged by the caller when
+    throughput dropped by more than threshold percent.
+    """
+    old_runs = {tuple(run.get(k) for k in RESULT_KEY): run for run in old['results']}
+    rows = []
+    for run in new['results']:
+        before = old_runs.get(tuple(run.get(k) for k in RESULT_KEY))
+        if before is None or not before['mb_per_second']:
+            continue
+        change = 100 * (run['mb_per_second'] - before['mb_per_second']) / before['mb_per_second']
+        rows.append((describe(run), before['mb_per_second'], run['mb_per_second'], change))
+    return rows
+
+
+def time_interpreter():
+    """Seconds to start and stop an interpreter that does nothing"""
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "pass"], check=True)
+    return time.perf_counter() - start
+
+
+def time_python(code):
+    """Run code in a fresh interpreter and return the number it prints last"""
+    result = subprocess.run([sys.executable, "-c", code], cwd=APP_DIR,
+                            capture_output=True, text=True, check=True)
+    return float(result.stdout.split()[-1])
+
+
+def time_import(module):
+    """Seconds a fresh interpreter takes to import a module"""
+    return time_python("import time; start = time.perf_counter(); "
+                       f"import {module}; print(time.perf_counter() - start)")
+
+
+def time_first_window():
+    """Seconds from launching the GUI until its window is drawn
+
+    Includes starting the interpreter. Returns None when the window cannot
+    be shown, e.g. without a display.
+    """
+    env = dict(os.environ, **{STARTUP_BENCHMARK_ENV: "1"})
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, os.path.join(APP_DIR, "file_hash_verifier.py")],
+                               cwd=APP_DIR, env=env, stdout=subprocess.PIPE,
+                               stderr=subprocess.DEVNULL, text=True)
+    try:
+        line = process.stdout.readline()
+        elapsed = time.perf_counter() - start
+        process.wait(timeout=STARTUP_TIMEOUT)
+    finally:
+        if process.poll() is None:
+            process.kill()
+        process.stdout.close()
+    return elapsed if line.strip() else None
+
+
+# Start-up measurements: name and function returning seconds (or None)
+STARTUP_STEPS = [
+    ("python start", time_interpreter),
+    ("import hash_core", lambda: time_import("hash_core")),
+    ("import hash_cli", lambda: time_import("hash_cli")),
+    ("import file_hash_verifier", lambda: time_import("file_hash_verifier")),
+    ("first window", time_first_window)
+]
+
+
+def run_startup(runs=5, report=None):
+    """Return {step: median seconds} over several runs of each start-up step
+
+    Steps that cannot run here (no display for the window) are None.
+    """
+    results = {}
+    for name, step in STARTUP_STEPS:
+        times = [step() for _ in range(runs)]
+        times = [t for t in times if t is not None]
+        results[name] = statistics.median(times) if times else None
+        if report is not None:
+            report(name, results[name])
+    return results
+
+
+def compare_startup(old, new):
+    """Return (step, old seconds, new seconds, change %) rows for start-up results"""
+    rows = []
+    for name, after in new['startup'].items():
+        before = old['startup'].get(name)
+        if before and after is not None:
+            rows.append((name, before, after, 100 * (after - before) / before))
+    return rows
+
+
+def format_size(size):
+    """Format a byte count as KiB/MiB/GiB"""
+    if size >= 1024 * 1024 * 1024:
+        return f"{size / (1024 * 1024 * 1024):.1f} GiB"
+    if size >= 1024 * 1024:
+        return f"{size / (1024 * 1024):g} MiB"
+    return f"{size / 1024:g} KiB"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="File Hash Verifier benchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    chunks = commands.add_parser("chunks", help="MB/s for each read size")
+    chunks.add_argument("file", nargs="?", help="file to hash (default: temporary file)")
+    chunks.add_argument("--algorithm", default="sha256")
+    chunks.add_argument("--size-mb", type=int, default=256)
+    chunks.add_argument("--repeat", type=int, default=3)
+
+    suite = commands.add_parser("suite", help="every algorithm, read strategy and worker count")
+    suite.add_argument("--dir", help="where to create the test files (default: temporary folder)")
+    suite.add_argument("--output", help="JSON file for the results (default: hash_bench_<date>.json)")
+    suite.add_argument("--algorithms", help="comma separated algorithms (default: all available)")
+    suite.add_argument("--algorithm", default="sha256",
+                       help="algorithm of the read, chunk, tree and batch runs")
+    suite.add_argument("--small-files", type=int, default=SMALL_FILES)
+    suite.add_argument("--small-size-kb", type=int, default=SMALL_FILE_SIZE // 1024)
+    suite.add_argument("--large-files", type=int, default=LARGE_FILES)
+    suite.add_argument("--large-size-mb", type=int, default=LARGE_FILE_SIZE // (1024 * 1024))
+    suite.add_argument("--warm-only", action="store_true", help="skip the cold page cache runs")
+    suite.add_argument("--quick", action="store_true", help="a small data set for a fast check")
+
+    startup = commands.add_parser("startup", help="import time and time to the first window")
+    startup.add_argument("--runs", type=int, default=5, help="runs per step; the median is kept")
+    startup.add_argument("--output", help="JSON file for the results (default: hash_bench_startup_<date>.json)")
+
+    compare = commands.add_parser("compare", help="compare two suite or start-up result files")
+    compare.add_argument("old")
+    compare.add_argument("new")
+    compare.add_argument("--threshold", type=float, default=10.0,
+                         help="report drops in MB/s (or start-up slowdowns) larger than this percentage")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "chunks":
+        path = args.file or make_test_file(args.size_mb * 1024 * 1024)
+        try:
+            print(f"{args.algorithm.upper()} on {path} "
+                  f"({os.path.getsize(path) / (1024 * 1024):.0f} MiB)")
+            for label, chunk_size, mb_s in chunk_size_benchmark(path, args.algorithm, repeat=args.repeat):
+                print(f"  {label:<18} {format_size(chunk_size):>10}  {mb_s:8.1f} MB/s")
+        finally:
+            if not args.file:
+                os.remove(path)
+
+    elif args.command == "suite":
+        if args.quick:
+            # Only sizes left at their defaults are shrunk
+            for key, default, quick in (("small_files", SMALL_FILES, 200), ("large_files", LARGE_FILES, 1),
+                                        ("large_size_mb", LARGE_FILE_SIZE // (1024 * 1024), 32)):
+                if getattr(args, key) == default:
+                    setattr(args, key, quick)
+        directory = tempfile.mkdtemp(prefix="fhv_suite_", dir=args.dir)
+        parameters = {key: getattr(args, key) for key in
+                      ("algorithms", "algorithm", "small_files", "small_size_kb",
+                       "large_files", "large_size_mb", "warm_only")}
+        try:
+            print(f"Creating {args.small_files} x {args.small_size_kb} KiB and "
+                  f"{args.large_files} x {args.large_size_mb} MiB files in {directory}")
+            small, large = make_dataset(directory, args.small_files, args.small_size_kb * 1024,
+                                        args.large_files, args.large_size_mb * 1024 * 1024)
+            algorithms = args.algorithms.split(',') if args.algorithms else None
+            runs = run_suite(small, large, algorithms, args.algorithm,
+                             caches=("warm",) if args.warm_only else ("cold", "warm"),
+                             report=lambda result: print(format_result(result), flush=True))
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+        output = args.output or f"hash_bench_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+        save_results(runs, output, parameters)
+        print(f"Results saved to: {output}")
+
+    elif args.command == "startup":
+        def report(name, seconds):
+            print(f"  {name:<28} {f'{seconds * 1000:.0f} ms' if seconds is not None else 'n/a':>10}", flush=True)
+
+        results = run_startup(args.runs, report)
+        output = args.output or f"hash_bench_startup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump({
+                'date': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'runs': args.runs,
+                'startup': results
+            }, f, indent=2)
+        print(f"Results saved to: {output}")
+
+    elif args.command == "compare":
+        with open(args.old, 'r', encoding='utf-8') as f:
+            old = json.load(f)
+        with open(args.new, 'r', encoding='utf-8') as f:
+            new = json.load(f)
+        regressions = 0
+        if 'startup' in old and 'startup' in new:
+            for name, before, after, change in compare_startup(old, new):
+                flag = ""
+                if change > args.threshold:
+                    flag = "  REGRESSION"
+                    regressions += 1
+                print(f"  {name:<28} {before * 1000:7.0f} -> {after * 1000:7.0f} ms {change:+6.1f}%{flag}")
+            if regressions:
+                print(f"{regressions} steps slower by more than {args.threshold:g}%")
+                return 1
+            return 0
+        for label, before, after, change in compare_results(old, new, args.threshold):
+            flag = ""
+            if change < -args.threshold:
+                flag = "  REGRESSION"
+                regressions += 1
+            print(f"  {label:<48} {before:9.1f} -> {after:9.1f} MB/s {change:+6.1f}%{flag}")
+        if regressions:
+            print(f"{regressions} runs slower by more than {args.threshold:g}%")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,240 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from hash_core import compute_digest
+
+# Default file name of the cache database inside the log directory
+CACHE_FILE = "hash_cache.sqlite3"
+# Default log directory of the application, where settings.json lives
+DEFAULT_LOG_DIR = os.path.expanduser("~/Documents/FileHashVerifier")
+# Least recently used entries are evicted beyond this many entries
+MAX_ENTRIES = 1000000
+# How many writes happen between two eviction checks
+EVICT_INTERVAL = 1000
+# Schema version of the database, kept in PRAGMA user_version
+CACHE_VERSION = 1
+
+
+def stat_key(st):
+    """Return the (size, mtime_ns, inode) part of a cache key"""
+    return st.st_size, st.st_mtime_ns, st.st_ino
+
+
+def default_log_dir():
+    """Return the log directory configured in the GUI's settings.json"""
+    log_dir = DEFAULT_LOG_DIR
+    try:
+        with open(os.path.join(DEFAULT_LOG_DIR, "settings.json"), 'r') as f:
+            log_dir = json.load(f).get('log_dir', log_dir)
+    except (OSError, ValueError):
+        pass
+    return log_dir
+
+
+def default_cache_path():
+    """Return the path of the cache used by the GUI
+
+    The log directory configured in settings.json is honoured, so scripts
+    share the cache with the application.
+    """
+    return os.path.join(default_log_dir(), CACHE_FILE)
+
+
+def cached_digest(cache, file_path, algorithm, trust_cache=True, telemetry=None, **options):
+    """Hash a file through the cache
+
+    With trust_cache the cached digest of an unchanged file is returned
+    without reading it; otherwise the file is hashed with compute_digest
+    (options are passed on) and the cache is refreshed. cache may be None.
+    With a telemetry.Telemetry the file's timings are recorded.
+    """
+    if telemetry is not None:
+        return telemetry.digest(file_path, cached_digest, cache, file_path, algorithm,
+                                trust_cache, **options)
+    timings = options.get('timings')
+    start = time.perf_counter()
+    st = os.stat(file_path)
+    if timings is not None:
+        timings['stat'] += time.perf_counter() - start
+    if cache is not None and trust_cache:
+        cached = cache.lookup(file_path, algorithm, st)
+        if cached is not None:
+            if options.get('progress') is not None:
+                options['progress'](st.st_size)
+            return cached
+    hash_value = compute_digest(file_path, algorithm, **options)
+    if cache is not None:
+        try:
+            cache.store(file_path, algorithm, hash_value, st)
+        except sqlite3.Error:
+            # A broken cache must not turn into a failed hash
+            pass
+    return hash_value
+
+
+class HashCache:
+    """On-disk digest cache keyed by (path, size, mtime_ns, inode, algorithm)
+
+    An entry is only returned while the file's size, modification time and
+    inode still match the values stored with it, so any change to the file
+    invalidates its digests. The cache is safe to share between threads.
+    """
+
+    def __init__(self, db_path, max_entries=MAX_ENTRIES):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.writes = 0
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS digests (
+                    path TEXT NOT NULL,
+                    algorithm TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    inode INTEGER NOT NULL,
+                    digest TEXT NOT NULL,
+                    last_used REAL NOT NULL,
+                    PRIMARY KEY (path, algorithm)
+                )
+            """)
+            self.conn.execute("CREATE INDEX IF NOT EXISTS digests_last_used ON digests (last_used)")
+            if self.conn.execute("PRAGMA user_version").fetchone()[0] < CACHE_VERSION:
+                # Tree roots are computed differently since version 1
+                self.conn.execute("DELETE FROM digests WHERE algorithm LIKE 'tree-%'")
+                self.conn.execute(f"PRAGMA user_version = {CACHE_VERSION}")
+
+    def get(self, path, algorithm, st=None):
+        """Return the cached digest of a file, or None if missing or stale"""
+        return self.get_many([(path, algorithm, st)])[0]
+
+    def get_many(self, items):
+        """Look up several (path, algorithm, stat) items in one transaction
+
+        Returns a list of digests (or None) in the same order. stat may be None,
+        in which case the file is stat'ed here.
+        """
+        results = []
+        now = time.time()
+        hits = []
+        stale = []
+        with self.lock, self.conn:
+            for path, algorithm, st in items:
+                path = os.path.abspath(path)
+                try:
+                    key = stat_key(st or os.stat(path))
+                except OSError:
+                    results.append(None)
+                    continue
+                row = self.conn.execute(
+                    "SELECT size, mtime_ns, inode, digest FROM digests WHERE path = ? AND algorithm = ?",
+                    (path, algorithm)).fetchone()
+                if row is None:
+                    results.append(None)
+                elif tuple(row[:3]) != key:
+                    stale.append((path, algorithm))
+                    results.append(None)
+                else:
+                    hits.append((now, path, algorithm))
+                    results.append(row[3])
+            if hits:
+                self.conn.executemany(
+                    "UPDATE digests SET last_used = ? WHERE path = ? AND algorithm = ?", hits)
+            if stale:
+                self.conn.executemany(
+                    "DELETE FROM digests WHERE path = ? AND algorithm = ?", stale)
+        return results
+
+    def lookup(self, path, algorithm, st=None):
+        """Return the cached hash for an algorithm name or list of names"""
+        return self.lookup_many([(path, st)], algorithm)[0]
+
+    def store(self, path, algorithm, hash_value, st=None):
+        """Store a hash returned by compute_digest"""
+        self.store_many([(path, hash_value, st)], algorithm)
+
+    def lookup_many(self, items, algorithm):
+        """Look up (path, stat) items for an algorithm name or list of names
+
+        Returns a list with, per item, the cached digest (a dict of digests
+        for a list of names) or None unless every digest is cached.
+        """
+        names = list(algorithm) if isinstance(algorithm, (list, tuple)) else [algorithm]
+        digests = self.get_many([(path, name, st) for path, st in items for name in names])
+        results = []
+        for i in range(len(items)):
+            found = digests[i * len(names):(i + 1) * len(names)]
+            if None in found:
+                results.append(None)
+            elif isinstance(algorithm, (list, tuple)):
+                results.append(dict(zip(names, found)))
+            else:
+                results.append(found[0])
+        return results
+
+    def store_many(self, items, algorithm):
+        """Store (path, hash, stat) items hashed with lookup_many's algorithm"""
+        rows = []
+        for path, hash_value, st in items:
+            if isinstance(hash_value, dict):
+                rows.extend((path, name, digest, st) for name, digest in hash_value.items())
+            else:
+                rows.append((path, algorithm, hash_value, st))
+        self.put_many(rows)
+
+    def put(self, path, algorithm, digest, st=None):
+        """Store the digest of a file"""
+        self.put_many([(path, algorithm, digest, st)])
+
+    def put_many(self, items):
+        """Store several (path, algorithm, digest, stat) items in one transaction
+
+        The stat result should be taken before the file was hashed, so a file
+        changed while it was being read is not cached with its new metadata.
+        """
+        now = time.time()
+        rows = []
+        for path, algorithm, digest, st in items:
+            path = os.path.abspath(path)
+            try:
+                size, mtime_ns, inode = stat_key(st or os.stat(path))
+            except OSError:
+                continue
+            rows.append((path, algorithm, size, mtime_ns, inode, digest, now))
+        if not rows:
+            return
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO digests VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            self.writes += len(rows)
+            if self.writes >= EVICT_INTERVAL:
+                self.writes = 0
+                self.evict()
+
+    def evict(self):
+        """Drop the least recently used entries beyond max_entries
+
+        Must be called with the lock held inside a transaction.
+        """
+        count = self.conn.execute("SELECT COUNT(*) FROM digests").fetchone()[0]
+        if count > self.max_entries:
+            self.conn.execute(
+                "DELETE FROM digests WHERE rowid IN "
+                "(SELECT rowid FROM digests ORDER BY last_used LIMIT ?)",
+                (count - self.max_entries,))
+
+    def clear(self):
+        """Remove every cached digest"""
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM digests")
+
+    def close(self):
+        """Close the database connection"""
+        with self.lock:
+            self.conn.close()
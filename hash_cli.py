@@ -0,0 +1,760 @@
+"""Command-line interface of File Hash Verifier
+
+Runs the hashing core without tkinter, for build agents, containers and
+scripts:
+
+    python file_hash_verifier.py hash FILE... [-a sha256]
+    python file_hash_verifier.py verify FILE EXPECTED_HASH [-a sha256]
+    python file_hash_verifier.py compare FILE1 FILE2 [-a sha256]
+    python file_hash_verifier.py copy SOURCE DEST [-a sha256] [--no-verify] [--no-hash-file]
+    python file_hash_verifier.py batch PATH... [-r] [--workers N] [--manifest DIR]
+    python file_hash_verifier.py check SHA256SUMS...
+    python file_hash_verifier.py algorithms
+    python file_hash_verifier.py dupes PATH... [-r]
+    python file_hash_verifier.py archive ARCHIVE... [-a sha256] [--manifest | --check SHA256SUMS]
+    python file_hash_verifier.py tree FILE [--save TREE.json | --check TREE.json]
+    python file_hash_verifier.py baseline save DIR BASELINE.json
+    python file_hash_verifier.py baseline check BASELINE.json [--update]
+    python file_hash_verifier.py watch DIR [--index INDEX.json] [--poll]
+    python file_hash_verifier.py history [--digest HASH | --path FILE] [--limit N] [--export FILE]
+    python file_hash_verifier.py serve [--socket PATH | --port N] [--workers N]
+    python file_hash_verifier.py client FILE... [--socket PATH | --port N] [-a sha256]
+
+Exit codes: 0 success, 1 hash mismatch or files differ, 2 usage error,
+3 a file could not be read.
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+
+from algorithms import ALGORITHMS, new_hash, available_algorithms, algorithm_label, measure_throughput
+from hash_core import MULTI_ALGORITHMS, READ_MODES
+from hash_cache import HashCache, cached_digest, default_cache_path, default_log_dir
+from hash_engine import HashEngine, BACKENDS, SCHEDULES
+from file_scanner import scan_tree, split_patterns, SYMLINK_POLICIES
+from manifest import ALGORITHM_BY_LENGTH, ManifestWriter, verify_manifest, write_sidecars, OK
+from file_compare import compare_files
+from duplicates import find_duplicates
+from tree_hash import (is_tree_algorithm, base_algorithm, tree_hash, load_tree, save_tree,
+                       check_chunks, TREE_CHUNK_SIZE)
+from baseline import create_baseline, check_baseline, load_baseline, save_baseline, UNCHANGED
+from history_store import HistoryStore, HISTORY_FILE, STATUS_VALID, STATUS_INVALID, STATUS_HASHED
+from history_export import export_history, format_from_path, EXPORTERS
+
+EXIT_OK = 0
+EXIT_MISMATCH = 1
+EXIT_USAGE = 2
+EXIT_ERROR = 3
+
+
+def parse_algorithm(text):
+    """Turn "sha256", "md5,sha1" or "multi" into compute_digest's argument"""
+    if text == "multi":
+        return list(MULTI_ALGORITHMS)
+    names = [name.strip().lower() for name in text.split(',') if name.strip()]
+    for name in names:
+        # Raises ValueError for unknown names before any file is read
+        new_hash(base_algorithm(name))
+    if len(names) > 1 and any(is_tree_algorithm(name) for name in names):
+        raise ValueError("tree algorithms cannot be combined with others")
+    return names if len(names) > 1 else names[0]
+
+
+def open_cache(args):
+    """Open the cache requested with --cache, or return None"""
+    if args.cache is None:
+        return None
+    path = args.cache or default_cache_path()
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        return HashCache(path)
+    except (OSError, sqlite3.Error) as e:
+        print(f"warning: cache not used: {e}", file=sys.stderr)
+        return None
+
+
+def digest_options(args):
+    """Return the compute_digest options given on the command line"""
+    return {'read_mode': args.read_mode}
+
+
+def make_engine(args):
+    """Create the HashEngine of a multi-file command from its options"""
+    return HashEngine(args.backend, args.workers, read_mode=args.read_mode,
+                      cache=open_cache(args), trust_cache=not args.rehash,
+                      schedule=args.schedule, device_workers=args.device_workers)
+
+
+def emit(args, record, text):
+    """Print a result as a JSON line or as text"""
+    if args.format == "json":
+        print(json.dumps(record), flush=True)
+    else:
+        print(text, flush=True)
+
+
+def format_hash_lines(path, hash_value):
+    """Format a hash in sha256sum style, or BSD style for several digests"""
+    if isinstance(hash_value, dict):
+        return "\n".join(f"{alg.upper()} ({path}) = {value}" for alg, value in hash_value.items())
+    return f"{hash_value}  {path}"
+
+
+def error(args, path, e):
+    """Report a file that could not be hashed"""
+    if args.format == "json":
+        print(json.dumps({'path': path, 'error': str(e)}), flush=True)
+    print(f"{path}: {e}", file=sys.stderr)
+
+
+def cmd_hash(args):
+    """Print the hash of each file"""
+    algorithm = parse_algorithm(args.algorithm)
+    cache = open_cache(args)
+    status = EXIT_OK
+    for path in args.files:
+        try:
+            hash_value = cached_digest(cache, path, algorithm, not args.rehash, **digest_options(args))
+        except Exception as e:
+            error(args, path, e)
+            status = EXIT_ERROR
+            continue
+        emit(args, {'path': path, 'algorithm': algorithm, 'hash': hash_value},
+             format_hash_lines(path, hash_value))
+    return status
+
+
+def cmd_verify(args):
+    """Check a file against an expected hash"""
+    expected = args.expected.strip().lower()
+    if args.algorithm:
+        algorithm = parse_algorithm(args.algorithm)
+        if isinstance(algorithm, list):
+            # Only the digest that can match the expected hash is computed
+            matching = [name for name in algorithm if new_hash(name).digest_size * 2 == len(expected)]
+            if len(matching) != 1:
+                print(f"{len(matching) or 'None'} of {', '.join(algorithm)} give a "
+                      f"{len(expected)} digit hash, use a single --algorithm", file=sys.stderr)
+                return EXIT_USAGE
+            algorithm = matching[0]
+    else:
+        algorithm = ALGORITHM_BY_LENGTH.get(len(expected))
+    if algorithm is None:
+        print(f"Cannot tell the algorithm of a {len(expected)} digit hash, use --algorithm",
+              file=sys.stderr)
+        return EXIT_USAGE
+    try:
+        hash_value = cached_digest(open_cache(args), args.file, algorithm, not args.rehash,
+                                   **digest_options(args))
+    except Exception as e:
+        error(args, args.file, e)
+        return EXIT_ERROR
+    verified = hash_value.lower() == expected
+    emit(args, {'path': args.file, 'algorithm': algorithm, 'hash': hash_value,
+                'expected': expected, 'verified': verified},
+         f"{args.file}: {'OK' if verified else 'FAILED'}")
+    return EXIT_OK if verified else EXIT_MISMATCH
+
+
+def cmd_compare(args):
+    """Check whether two files have the same content
+
+    Sizes and head/tail blocks are compared before the files are hashed,
+    so the hashes are only printed when both files were read in full.
+    """
+    algorithm = parse_algorithm(args.algorithm)
+    try:
+        result = compare_files(args.file1, args.file2, algorithm, open_cache(args), not args.rehash,
+                               **digest_options(args))
+    except OSError as e:
+        error(args, e.filename or args.file1, e)
+        return EXIT_ERROR
+    emit(args, {'file1': args.file1, 'file2': args.file2, 'algorithm': algorithm,
+                'hash1': result.hash1, 'hash2': result.hash2, 'identical': result.identical,
+                'stage': result.stage},
+         f"Files are {'identical' if result.identical else 'different'} (decided by {result.stage})")
+    return EXIT_OK if result.identical else EXIT_MISMATCH
+
+
+def cmd_copy(args):
+    """Copy a file while hashing it, then re-read the copy to confirm it"""
+    # Imported here: only this command copies files
+    from file_copy import copy_and_verify
+    algorithm = parse_algorithm(args.algorithm)
+    try:
+        result = copy_and_verify(args.source, args.destination, algorithm, verify=not args.no_verify)
+    except OSError as e:
+        error(args, e.filename or args.source, e)
+        return EXIT_ERROR
+    hash_files = []
+    if not args.no_hash_file and result.verified is not False:
+        hash_files = write_sidecars(result.destination, result.hash_value, algorithm)
+    if result.verified is None:
+        outcome = "copied"
+    else:
+        outcome = f"{'OK' if result.verified else 'FAILED'} ({result.verify_method})"
+    emit(args, {'source': result.source, 'destination': result.destination, 'algorithm': algorithm,
+                'hash': result.hash_value, 'verify_hash': result.verify_hash,
+                'verified': result.verified, 'verify_method': result.verify_method,
+                'hash_files': hash_files},
+         format_hash_lines(result.destination, result.hash_value) + f"\n{result.destination}: {outcome}")
+    return EXIT_MISMATCH if result.verified is False else EXIT_OK
+
+
+def iter_batch_paths(args, errors):
+    """Yield the files given to batch, scanning directories with -r"""
+    for path in args.paths:
+        if os.path.isdir(path):
+            if not args.recursive:
+                errors.append(f"{path}: is a directory (use -r)")
+                continue
+            yield from scan_tree(path,
+                                 include=split_patterns(args.include),
+                                 exclude=split_patterns(args.exclude),
+                                 symlinks=args.symlinks,
+                                 include_hidden=args.hidden,
+                                 max_depth=args.max_depth,
+                                 on_error=lambda e: errors.append(str(e)))
+        else:
+            yield path
+
+
+def cmd_batch(args):
+    """Hash many files in parallel, printing results in input order"""
+    algorithm = parse_algorithm(args.algorithm)
+    engine = make_engine(args)
+    errors = []
+    status = EXIT_OK
+    writer = None
+    if args.manifest:
+        names = algorithm if isinstance(algorithm, list) else [algorithm]
+        writer = ManifestWriter(args.manifest, names)
+    paths = iter_batch_paths(args, errors)
+    if writer is not None:
+        paths = writer.skip_own(paths)
+    try:
+        for index, path, hash_value, e in engine.hash_ordered(paths, algorithm):
+            if hash_value is None:
+                error(args, path, e)
+                status = EXIT_ERROR
+                continue
+            if writer is not None:
+                writer.add(path, hash_value)
+            emit(args, {'path': path, 'algorithm': algorithm, 'hash': hash_value},
+                 format_hash_lines(path, hash_value))
+    finally:
+        if writer is not None:
+            writer.close()
+    for message in errors:
+        print(message, file=sys.stderr)
+    return EXIT_ERROR if errors else status
+
+
+def cmd_check(args):
+    """Verify the files listed in checksum manifests, like sha256sum -c"""
+    engine = make_engine(args)
+    errors = []
+    counts = {}
+    for manifest_path in args.manifests:
+        try:
+            for entry, status, actual, e in verify_manifest(manifest_path, args.algorithm, engine, errors):
+                counts[status] = counts.get(status, 0) + 1
+                if args.quiet and status == OK:
+                    continue
+                emit(args, {'manifest': manifest_path, 'path': entry.name,
+                            'algorithm': entry.algorithm, 'expected': entry.expected,
+                            'hash': actual, 'status': status, 'error': e},
+                     f"{entry.name}: {status}")
+        except OSError as e:
+            errors.append(f"{manifest_path}: {e}")
+    for message in errors:
+        print(message, file=sys.stderr)
+    failed = sum(count for status, count in counts.items() if status != OK)
+    if failed:
+        print(f"WARNING: {failed} of {sum(counts.values())} listed files did not match or are missing",
+              file=sys.stderr)
+        return EXIT_MISMATCH
+    return EXIT_ERROR if errors else EXIT_OK
+
+
+def cmd_archive(args):
+    """Hash the members of zip and tar archives, or check them against a manifest"""
+    # Imported here: only this command needs tarfile, zipfile and lzma
+    from archive_hash import hash_archive, verify_archive, archive_manifest_writer, ARCHIVE_ERRORS
+    errors = []
+    counts = {}
+    if args.check:
+        for archive in args.archives:
+            try:
+                for entry, status, actual, e in verify_archive(archive, args.check, args.algorithm,
+                                                               args.workers, errors=errors):
+                    counts[status] = counts.get(status, 0) + 1
+                    if args.quiet and status == OK:
+                        continue
+                    emit(args, {'archive': archive, 'path': entry.name,
+                                'algorithm': entry.algorithm, 'expected': entry.expected,
+                                'hash': actual, 'status': status, 'error': str(e) if e else None},
+                         f"{entry.name}: {status}" + (f" ({e})" if e else ""))
+            except ARCHIVE_ERRORS as e:
+                errors.append(f"{archive}: {e}")
+        for message in errors:
+            print(message, file=sys.stderr)
+        failed = sum(count for status, count in counts.items() if status != OK)
+        if failed:
+            print(f"WARNING: {failed} of {sum(counts.values())} listed members did not match or are missing",
+                  file=sys.stderr)
+            return EXIT_MISMATCH
+        return EXIT_ERROR if errors else EXIT_OK
+
+    algorithm = parse_algorithm(args.algorithm or "sha256")
+    if isinstance(algorithm, str) and is_tree_algorithm(algorithm):
+        raise ValueError("tree algorithms cannot be used for archive members")
+    status = EXIT_OK
+    for archive in args.archives:
+        writer = None
+        try:
+            if args.manifest:
+                writer = archive_manifest_writer(archive, algorithm if isinstance(algorithm, list) else [algorithm])
+            for name, size, hash_value, e in hash_archive(archive, algorithm, args.workers):
+                if hash_value is None:
+                    error(args, f"{archive}:{name}", e)
+                    status = EXIT_ERROR
+                    continue
+                if writer is not None:
+                    writer.add_name(name, hash_value)
+                emit(args, {'archive': archive, 'path': name, 'size': size,
+                            'algorithm': algorithm, 'hash': hash_value},
+                     format_hash_lines(name, hash_value))
+            if writer is not None:
+                print("manifest written to " + ", ".join(writer.paths.values()), file=sys.stderr)
+        except ARCHIVE_ERRORS as e:
+            error(args, archive, e)
+            status = EXIT_ERROR
+        finally:
+            if writer is not None:
+                writer.close()
+    return status
+
+
+def cmd_dupes(args):
+    """Print groups of identical files, largest savings first"""
+    algorithm = parse_algorithm(args.algorithm)
+    if isinstance(algorithm, list):
+        raise ValueError("dupes needs a single algorithm")
+    engine = make_engine(args)
+    errors = []
+    groups = find_duplicates(iter_batch_paths(args, errors), algorithm, engine,
+                             min_size=args.min_size, errors=errors)
+    for group in groups:
+        emit(args, {'size': group.size, 'algorithm': algorithm, 'hash': group.hash_value,
+                    'reclaimable': group.reclaimable, 'paths': group.paths},
+             "\n".join(group.paths) + "\n")
+    for message in errors:
+        print(message, file=sys.stderr)
+    reclaimable = sum(group.reclaimable for group in groups)
+    print(f"{len(groups)} groups of duplicates, {reclaimable} bytes reclaimable", file=sys.stderr)
+    return EXIT_ERROR if errors else EXIT_OK
+
+
+def cmd_tree(args):
+    """Hash a file as parallel chunks, or find the chunks that changed"""
+    try:
+        if args.check:
+            tree = load_tree(args.check)
+            indexes = [int(i) for i in args.chunks.split(',')] if args.chunks else None
+            bad = check_chunks(args.file, tree, indexes, args.workers)
+            for index in bad:
+                offset, length = tree.chunk_range(index)
+                emit(args, {'path': args.file, 'chunk': index, 'offset': offset, 'length': length},
+                     f"{args.file}: chunk {index} differs (bytes {offset}-{offset + max(length, 1) - 1})")
+            if not bad:
+                emit(args, {'path': args.file, 'root': tree.root, 'verified': True},
+                     f"{args.file}: OK")
+            return EXIT_MISMATCH if bad else EXIT_OK
+        algorithm = parse_algorithm(args.algorithm)
+        if isinstance(algorithm, list):
+            raise ValueError("tree needs a single algorithm")
+        tree = tree_hash(args.file, algorithm, args.chunk_size * 1024 * 1024, args.workers)
+        if args.save:
+            save_tree(tree, args.save)
+    except OSError as e:
+        error(args, args.file, e)
+        return EXIT_ERROR
+    emit(args, {'path': args.file, **tree.to_dict()}, f"{tree.root}  {args.file}")
+    return EXIT_OK
+
+
+def cmd_baseline(args):
+    """Save a baseline of a folder, or report what changed since one"""
+    engine = make_engine(args)
+    errors = []
+    try:
+        if args.action == "save":
+            algorithm = parse_algorithm(args.algorithm)
+            if isinstance(algorithm, list):
+                raise ValueError("a baseline needs a single algorithm")
+            baseline = create_baseline(args.directory, algorithm, engine, errors,
+                                       include=split_patterns(args.include),
+                                       exclude=split_patterns(args.exclude),
+                                       symlinks=args.symlinks,
+                                       include_hidden=args.hidden)
+            save_baseline(baseline, args.baseline)
+            print(f"{len(baseline['files'])} files recorded in {args.baseline}", file=sys.stderr)
+            status = EXIT_OK
+        else:
+            baseline = load_baseline(args.baseline)
+            counts = {}
+            for state, name, entry, e in check_baseline(baseline, engine, args.rehash, errors):
+                counts[state] = counts.get(state, 0) + 1
+                if e is not None:
+                    errors.append(f"{name}: {e}")
+                if state == UNCHANGED and not args.all:
+                    continue
+                emit(args, {'path': name, 'status': state,
+                            'hash': entry['hash'] if entry else None},
+                     f"{name}: {state}")
+            if args.update:
+                save_baseline(baseline, args.baseline)
+            print(", ".join(f"{count} {state}" for state, count in sorted(counts.items())) or "no files",
+                  file=sys.stderr)
+            status = EXIT_OK if set(counts) <= {UNCHANGED} else EXIT_MISMATCH
+    except OSError as e:
+        errors.append(str(e))
+        status = EXIT_ERROR
+    for message in errors:
+        print(message, file=sys.stderr)
+    return EXIT_ERROR if errors else status
+
+
+def cmd_watch(args):
+    """Keep a folder's index up to date and print changes until interrupted"""
+    # Imported here: only this command loads ctypes and inotify
+    from watcher import FolderWatcher, DEBOUNCE, POLL_INTERVAL
+    def on_changes(changes):
+        for state, path, entry, old_entry, e in changes:
+            if e is not None:
+                error(args, path, e)
+                continue
+            emit(args, {'path': path, 'status': state,
+                        'hash': entry['hash'] if entry else None,
+                        'previous': old_entry['hash'] if old_entry else None},
+                 f"{path}: {state}")
+
+    algorithm = parse_algorithm(args.algorithm)
+    if isinstance(algorithm, list):
+        raise ValueError("a folder index needs a single algorithm")
+    try:
+        watcher = FolderWatcher(args.directory, algorithm, make_engine(args), args.index,
+                                on_changes=on_changes,
+                                on_status=lambda message: print(message, file=sys.stderr, flush=True),
+                                debounce=DEBOUNCE if args.debounce is None else args.debounce,
+                                poll_interval=POLL_INTERVAL if args.interval is None else args.interval,
+                                use_inotify=not args.poll,
+                                include=split_patterns(args.include),
+                                exclude=split_patterns(args.exclude),
+                                symlinks=args.symlinks,
+                                include_hidden=args.hidden)
+    except (OSError, ValueError) as e:
+        print(f"{args.index}: {e}", file=sys.stderr)
+        return EXIT_ERROR
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        # run() saves the index on its way out
+        pass
+    return EXIT_ERROR if watcher.error is not None else EXIT_OK
+
+
+def cmd_algorithms(args):
+    """List the available algorithms with their measured throughput"""
+    for name in available_algorithms():
+        emit(args, {'name': name, 'label': algorithm_label(name, False),
+                    'security': ALGORITHMS[name].security, 'mb_per_second': round(measure_throughput(name), 1)},
+             f"{name:<10} {algorithm_label(name)}")
+    return EXIT_OK
+
+
+def cmd_history(args):
+    """Print entries of the GUI's verification history, newest first"""
+    path = args.db or os.path.join(default_log_dir(), HISTORY_FILE)
+    if not os.path.exists(path):
+        print(f"{path}: no history recorded", file=sys.stderr)
+        return EXIT_ERROR
+    store = HistoryStore(path, max_entries=0)
+    try:
+        if args.export:
+            format_type = args.export_format or format_from_path(args.export)
+            if format_type is None:
+                raise ValueError(f"cannot tell the export format of {args.export}, use --export-format")
+            count = export_history(store.entries(newest_first=False, limit=args.limit, path=args.path,
+                                                 digest=args.digest, status=args.status),
+                                   args.export, format_type)
+            print(f"{count} entries exported to {args.export}", file=sys.stderr)
+            return EXIT_OK
+        for entry in store.entries(limit=args.limit, path=args.path, digest=args.digest,
+                                   status=args.status):
+            verified = entry['verified']
+            status = STATUS_HASHED if verified is None else STATUS_VALID if verified else STATUS_INVALID
+            emit(args, entry, f"{entry['date']}  {status:<7}  {entry['algorithm']}  "
+                              f"{entry['hash'] or '-'}  {entry['file']}")
+    finally:
+        store.close()
+    return EXIT_OK
+
+
+def cmd_serve(args):
+    """Run the hashing service until Ctrl+C"""
+    # Imported here: asyncio is only needed by the service
+    from hash_service import run_service
+    address = args.port if args.port is not None else args.socket
+    try:
+        run_service(address, args.workers, args.max_pending,
+                    False if args.no_cache else args.cache, args.read_mode)
+    except (OSError, sqlite3.Error) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return EXIT_ERROR
+    return EXIT_OK
+
+
+def cmd_client(args):
+    """Ask a running hashing service for file hashes"""
+    from hash_service import ServiceClient, ServiceError
+    address = str(args.port) if args.port is not None else args.socket
+    client = ServiceClient(address)
+    status = EXIT_OK
+    try:
+        if args.status:
+            answer = client.status()
+            emit(args, answer, "\n".join(f"{name}: {value}" for name, value in answer.items()))
+        for path in args.files:
+            try:
+                answer = client.hash(path, args.algorithm, args.rehash)
+            except ServiceError as e:
+                error(args, path, e)
+                status = EXIT_ERROR
+                continue
+            emit(args, answer, format_hash_lines(path, answer['hash']))
+    except OSError as e:
+        print(f"error: cannot reach the hash service: {e}", file=sys.stderr)
+        return EXIT_ERROR
+    finally:
+        client.close()
+    return status
+
+
+def build_parser():
+    """Create the argument parser"""
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--format", choices=("text", "json"), default="text",
+                        help="output format (json prints one object per line)")
+    common.add_argument("--read-mode", choices=READ_MODES, default="buffered",
+                        help="how file contents are read")
+    common.add_argument("--cache", nargs="?", const="", default=None, metavar="PATH",
+                        help="use the digest cache (default: the one used by the GUI)")
+    common.add_argument("--rehash", action="store_true",
+                        help="ignore cached digests but refresh the cache")
+
+    parser = argparse.ArgumentParser(prog="file_hash_verifier",
+                                     description="Calculate and verify file hashes without the GUI")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    p = commands.add_parser("hash", parents=[common], help="print file hashes")
+    p.add_argument("files", nargs="+")
+    p.add_argument("-a", "--algorithm", default="sha256",
+                   help="algorithm, comma separated list, or multi")
+    p.set_defaults(func=cmd_hash)
+
+    p = commands.add_parser("verify", parents=[common], help="check a file against a hash")
+    p.add_argument("file")
+    p.add_argument("expected")
+    p.add_argument("-a", "--algorithm", help="algorithm (default: guessed from the hash length)")
+    p.set_defaults(func=cmd_verify)
+
+    p = commands.add_parser("compare", parents=[common], help="check whether two files match")
+    p.add_argument("file1")
+    p.add_argument("file2")
+    p.add_argument("-a", "--algorithm", default="sha256")
+    p.set_defaults(func=cmd_compare)
+
+    p = commands.add_parser("copy", parents=[common], help="copy a file, hashing it once and checking the copy")
+    p.add_argument("source")
+    p.add_argument("destination", help="file or directory to copy to")
+    p.add_argument("-a", "--algorithm", default="sha256",
+                   help="algorithm, comma separated list, or multi")
+    p.add_argument("--no-verify", action="store_true", help="do not re-read the copy")
+    p.add_argument("--no-hash-file", action="store_true", help="do not write DEST.<algorithm> hash files")
+    p.set_defaults(func=cmd_copy)
+
+    p = commands.add_parser("batch", parents=[common], help="hash many files in parallel")
+    p.add_argument("paths", nargs="+")
+    p.add_argument("-a", "--algorithm", default="sha256",
+                   help="algorithm, comma separated list, or multi")
+    p.add_argument("-r", "--recursive", action="store_true", help="scan directories")
+    p.add_argument("--include", help="glob patterns to include, separated by ';'")
+    p.add_argument("--exclude", help="glob patterns to exclude, separated by ';'")
+    p.add_argument("--symlinks", choices=SYMLINK_POLICIES, default="skip")
+    p.add_argument("--hidden", action="store_true", help="include hidden files")
+    p.add_argument("--max-depth", type=int)
+    p.add_argument("--backend", choices=BACKENDS, default="thread")
+    p.add_argument("--workers", type=int)
+    p.add_argument("--schedule", choices=SCHEDULES, default="input",
+                   help="read order: as given, or per device in disk order")
+    p.add_argument("--device-workers", type=int,
+                   help="with --schedule device, files read at once per device")
+    p.add_argument("--manifest", metavar="DIR",
+                   help="also write SHA256SUMS-style manifests to DIR, names relative to it")
+    p.set_defaults(func=cmd_batch)
+
+    p = commands.add_parser("check", parents=[common], help="verify files listed in checksum manifests")
+    p.add_argument("manifests", nargs="+")
+    p.add_argument("-a", "--algorithm", help="algorithm of GNU lines (default: from the file name or hash length)")
+    p.add_argument("-q", "--quiet", action="store_true", help="do not print OK lines")
+    p.add_argument("--backend", choices=BACKENDS, default="thread")
+    p.add_argument("--workers", type=int)
+    p.add_argument("--schedule", choices=SCHEDULES, default="input",
+                   help="read order: as given, or per device in disk order")
+    p.add_argument("--device-workers", type=int,
+                   help="with --schedule device, files read at once per device")
+    p.set_defaults(func=cmd_check)
+
+    p = commands.add_parser("dupes", parents=[common], help="find identical files")
+    p.add_argument("paths", nargs="+")
+    p.add_argument("-a", "--algorithm", default="sha256")
+    p.add_argument("-r", "--recursive", action="store_true", help="scan directories")
+    p.add_argument("--include", help="glob patterns to include, separated by ';'")
+    p.add_argument("--exclude", help="glob patterns to exclude, separated by ';'")
+    p.add_argument("--symlinks", choices=SYMLINK_POLICIES, default="skip")
+    p.add_argument("--hidden", action="store_true", help="include hidden files")
+    p.add_argument("--max-depth", type=int)
+    p.add_argument("--min-size", type=int, default=1, help="ignore files smaller than this many bytes")
+    p.add_argument("--backend", choices=BACKENDS, default="thread")
+    p.add_argument("--workers", type=int)
+    p.add_argument("--schedule", choices=SCHEDULES, default="input",
+                   help="read order: as given, or per device in disk order")
+    p.add_argument("--device-workers", type=int,
+                   help="with --schedule device, files read at once per device")
+    p.set_defaults(func=cmd_dupes)
+
+    p = commands.add_parser("archive", parents=[common],
+                            help="hash the files inside zip and tar archives without extracting them")
+    p.add_argument("archives", nargs="+", metavar="archive")
+    p.add_argument("-a", "--algorithm",
+                   help="algorithm, comma separated list, or multi (default: sha256, or from the manifest)")
+    p.add_argument("--workers", type=int, help="zip members hashed at the same time")
+    p.add_argument("--manifest", action="store_true",
+                   help="also write ARCHIVE.SHA256SUMS-style manifests next to each archive")
+    p.add_argument("--check", metavar="MANIFEST", help="verify the members listed in a checksum manifest")
+    p.add_argument("-q", "--quiet", action="store_true", help="with --check, do not print OK lines")
+    p.set_defaults(func=cmd_archive)
+
+    p = commands.add_parser("algorithms", parents=[common], help="list algorithms and their speed")
+    p.set_defaults(func=cmd_algorithms)
+
+    p = commands.add_parser("tree", parents=[common], help="hash one file as chunks on several threads")
+    p.add_argument("file")
+    p.add_argument("-a", "--algorithm", default="sha256", help="algorithm the chunks are hashed with")
+    p.add_argument("--chunk-size", type=int, default=TREE_CHUNK_SIZE // (1024 * 1024), metavar="MIB")
+    p.add_argument("--workers", type=int)
+    p.add_argument("--save", metavar="TREE.json", help="write the chunk digests to a file")
+    p.add_argument("--check", metavar="TREE.json", help="report the chunks that differ from a saved tree")
+    p.add_argument("--chunks", help="with --check, only re-read these comma separated chunk numbers")
+    p.set_defaults(func=cmd_tree)
+
+    p = commands.add_parser("history", parents=[common], help="query the GUI's verification history")
+    p.add_argument("--digest", help="only entries with this hash")
+    p.add_argument("--path", help="only entries of this file")
+    p.add_argument("--status", choices=(STATUS_VALID, STATUS_INVALID, STATUS_HASHED))
+    p.add_argument("--limit", type=int, help="print at most this many entries")
+    p.add_argument("--db", metavar="PATH", help="history database (default: the one used by the GUI)")
+    p.add_argument("--export", metavar="FILE", help="write the entries to a file instead of printing them")
+    p.add_argument("--export-format", choices=sorted(EXPORTERS),
+                   help="format of --export (default: from the file extension)")
+    p.set_defaults(func=cmd_history)
+
+    p = commands.add_parser("serve", help="run a local hashing service for other tools")
+    p.add_argument("--socket", metavar="PATH", help="Unix socket to listen on (default: in the log directory)")
+    p.add_argument("--port", type=int, help="listen on this 127.0.0.1 port instead of a socket")
+    p.add_argument("--workers", type=int, help="files hashed at the same time")
+    p.add_argument("--max-pending", type=int, help="jobs queued before requests are refused")
+    p.add_argument("--read-mode", choices=READ_MODES, default="buffered", help="how file contents are read")
+    p.add_argument("--cache", metavar="PATH", help="digest cache (default: the one used by the GUI)")
+    p.add_argument("--no-cache", action="store_true", help="always read the files")
+    p.set_defaults(func=cmd_serve)
+
+    p = commands.add_parser("client", help="hash files through a running service")
+    p.add_argument("files", nargs="*")
+    p.add_argument("-a", "--algorithm", default="sha256",
+                   help="algorithm, comma separated list, or multi")
+    p.add_argument("--socket", metavar="PATH", help="socket of the service (default: in the log directory)")
+    p.add_argument("--port", type=int, help="127.0.0.1 port of the service")
+    p.add_argument("--rehash", action="store_true", help="ignore cached digests but refresh the cache")
+    p.add_argument("--status", action="store_true", help="print the service's counters")
+    p.add_argument("--format", choices=("text", "json"), default="text",
+                   help="output format (json prints one object per line)")
+    p.set_defaults(func=cmd_client)
+
+    p = commands.add_parser("baseline", help="record a folder, or report what changed since")
+    actions = p.add_subparsers(dest="action", required=True)
+    a = actions.add_parser("save", parents=[common], help="hash every file in a folder")
+    a.add_argument("directory")
+    a.add_argument("baseline", help="JSON file to write")
+    a.add_argument("-a", "--algorithm", default="sha256")
+    a.add_argument("--include", help="glob patterns to include, separated by ';'")
+    a.add_argument("--exclude", help="glob patterns to exclude, separated by ';'")
+    a.add_argument("--symlinks", choices=SYMLINK_POLICIES, default="skip")
+    a.add_argument("--hidden", action="store_true", help="include hidden files")
+    a = actions.add_parser("check", parents=[common],
+                           help="hash files whose size or time changed and report differences")
+    a.add_argument("baseline")
+    a.add_argument("--update", action="store_true", help="record the current state in the baseline")
+    a.add_argument("--all", action="store_true", help="also print unchanged files")
+    for a in actions.choices.values():
+        a.add_argument("--backend", choices=BACKENDS, default="thread")
+        a.add_argument("--workers", type=int)
+        a.add_argument("--schedule", choices=SCHEDULES, default="input",
+                       help="read order: as given, or per device in disk order")
+        a.add_argument("--device-workers", type=int,
+                       help="with --schedule device, files read at once per device")
+    p.set_defaults(func=cmd_baseline)
+
+    p = commands.add_parser("watch", parents=[common], help="hash files as they change and print the changes")
+    p.add_argument("directory")
+    p.add_argument("--index", metavar="INDEX.json",
+                   help="baseline file kept up to date, so restarts only rehash what changed")
+    p.add_argument("-a", "--algorithm", default="sha256")
+    p.add_argument("--debounce", type=float, metavar="S",
+                   help="seconds a file must be unchanged before it is hashed (default: 2)")
+    p.add_argument("--poll", action="store_true", help="scan the folder instead of using inotify")
+    p.add_argument("--interval", type=float, metavar="S",
+                   help="seconds between scans when polling (default: 60)")
+    p.add_argument("--include", help="glob patterns to include, separated by ';'")
+    p.add_argument("--exclude", help="glob patterns to exclude, separated by ';'")
+    p.add_argument("--symlinks", choices=SYMLINK_POLICIES, default="skip")
+    p.add_argument("--hidden", action="store_true", help="include hidden files")
+    p.add_argument("--backend", choices=BACKENDS, default="thread")
+    p.add_argument("--workers", type=int)
+    p.add_argument("--schedule", choices=SCHEDULES, default="input",
+                   help="read order: as given, or per device in disk order")
+    p.add_argument("--device-workers", type=int,
+                   help="with --schedule device, files read at once per device")
+    p.set_defaults(func=cmd_watch)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        return args.func(args)
+    except ValueError as e:
+        # Unknown algorithm names and similar bad input
+        print(f"error: {e}", file=sys.stderr)
+        return EXIT_USAGE
+    except KeyboardInterrupt:
+        return 130
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,224 @@
+import mmap
+import os
+import stat
+import time
+
+from algorithms import new_hash
+
+# Bounds for the read size picked by choose_chunk_size
+MIN_CHUNK_SIZE = 64 * 1024
+MAX_CHUNK_SIZE = 1024 * 1024
+# Used when the filesystem does not report a block size
+DEFAULT_BLOCK_SIZE = 4096
+
+# How file contents are read; "mmap" falls back to "buffered" when needed
+READ_MODES = ("buffered", "mmap")
+# Files larger than this are not memory-mapped
+MMAP_LIMIT = 16 * 1024 * 1024 * 1024
+
+# Digests computed by the single-pass multi-algorithm mode
+MULTI_ALGORITHMS = ("md5", "sha1", "sha256", "sha512")
+
+
+class HashCancelled(Exception):
+    """Raised when hashing is stopped through a cancel event"""
+
+
+def default_workers():
+    """Return the default number of workers (one per core)"""
+    return os.cpu_count() or 1
+
+
+def choose_chunk_size(file_size, block_size=None):
+    """Pick a read size from the file size and the filesystem block size
+
+    Small files are read in one call. Larger files get a power-of-two
+    buffer of about 1/16 of the file, kept between MIN_CHUNK_SIZE and
+    MAX_CHUNK_SIZE and rounded up to a whole number of blocks.
+    """
+    block_size = block_size or DEFAULT_BLOCK_SIZE
+    chunk_size = MIN_CHUNK_SIZE
+    while chunk_size < MAX_CHUNK_SIZE and chunk_size * 16 < file_size:
+        chunk_size *= 2
+    if 0 < file_size < chunk_size:
+        # One read for the whole file, plus one byte to see the end
+        chunk_size = file_size + 1
+    return -(-chunk_size // block_size) * block_size
+
+
+def advise_sequential(f):
+    """Tell the OS the file will be read sequentially, where supported"""
+    if hasattr(os, 'posix_fadvise'):
+        try:
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        except OSError:
+            pass
+
+
+def iter_chunks(f, chunk_size):
+    """Yield the contents of an open file as memoryviews
+
+    The file is read with readinto into one reusable buffer, so no new bytes
+    object is created per chunk. Each view is only valid until the next one
+    is requested.
+    """
+    buffer = bytearray(chunk_size)
+    view = memoryview(buffer)
+    while True:
+        size = f.readinto(buffer)
+        if not size:
+            break
+        yield view[:size]
+
+
+def use_mmap(st, mmap_limit=MMAP_LIMIT):
+    """Return True if a file with this stat result can be memory-mapped
+
+    Pipes, devices and other special files, empty files and files above
+    mmap_limit bytes are read with buffered reads instead.
+    """
+    return stat.S_ISREG(st.st_mode) and 0 < st.st_size <= mmap_limit
+
+
+def iter_mmap_chunks(f, size, chunk_size):
+    """Yield slices of a read-only mapping of an open file as memoryviews"""
+    with mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) as mapping:
+        if hasattr(mapping, 'madvise') and hasattr(mmap, 'MADV_SEQUENTIAL'):
+            mapping.madvise(mmap.MADV_SEQUENTIAL)
+        with memoryview(mapping) as view:
+            for offset in range(0, size, chunk_size):
+                chunk = view[offset:offset + chunk_size]
+                try:
+                    yield chunk
+                finally:
+                    # The mapping cannot be closed while a slice is exported
+                    chunk.release()
+
+
+def read_chunks(file_path, chunk_size=None, read_mode="buffered", mmap_limit=MMAP_LIMIT,
+                progress=None, cancel_event=None, timings=None):
+    """Yield the contents of a file as memoryviews ready for hashlib
+
+    read_mode "buffered" fills a reusable buffer with readinto, "mmap" maps
+    the file and hands out slices of the mapping without copying. mmap falls
+    back to buffered reads for files use_mmap rejects or that cannot be
+    mapped. When chunk_size is not given it is picked from the file size.
+
+    progress is called with the size of each chunk once it has been used.
+    HashCancelled is raised between chunks once cancel_event is set.
+    With a timings dict (see telemetry.new_timings) the time spent opening
+    and reading the file and the bytes read are added to it.
+    """
+    chunks = _read_chunks(file_path, chunk_size, read_mode, mmap_limit, timings)
+    if timings is not None:
+        chunks = timed_chunks(chunks, timings)
+    for chunk in chunks:
+        if cancel_event is not None and cancel_event.is_set():
+            raise HashCancelled()
+        size = len(chunk)
+        yield chunk
+        if progress is not None:
+            progress(size)
+
+
+def timed_chunks(chunks, timings):
+    """Pass chunks through, adding the time spent waiting for each one"""
+    clock = time.perf_counter
+    try:
+        while True:
+            start = clock()
+            chunk = next(chunks, None)
+            timings['read'] += clock() - start
+            if chunk is None:
+                return
+            timings['bytes'] += len(chunk)
+            yield chunk
+    finally:
+        # Release the file (and any mapping) even when stopped early
+        chunks.close()
+
+
+def _read_chunks(file_path, chunk_size, read_mode, mmap_limit, timings=None):
+    """Pick the read strategy for read_chunks"""
+    if read_mode not in READ_MODES:
+        raise ValueError(f"Unknown read mode: {read_mode}")
+    start = time.perf_counter()
+    with open(file_path, 'rb', buffering=0) as f:
+        st = os.fstat(f.fileno())
+        if timings is not None:
+            timings['open'] += time.perf_counter() - start
+        if not chunk_size:
+            chunk_size = choose_chunk_size(st.st_size, getattr(st, 'st_blksize', None))
+        if read_mode == "mmap" and use_mmap(st, mmap_limit):
+            try:
+                chunks = iter_mmap_chunks(f, st.st_size, chunk_size)
+                first = next(chunks)
+            except (ValueError, OSError):
+                pass
+            else:
+                yield first
+                yield from chunks
+                return
+        advise_sequential(f)
+        yield from iter_chunks(f, chunk_size)
+
+
+def hash_file(file_path, algorithm, chunk_size=None, read_mode="buffered", mmap_limit=MMAP_LIMIT,
+              progress=None, cancel_event=None, timings=None):
+    """Calculate the hex digest of a file
+
+    Unlike FileHashVerifier.calculate_hash this does not touch the GUI, so it
+    can run inside worker threads and worker processes. Errors are raised to
+    the caller. See read_chunks for the other arguments.
+    """
+    hash_obj = new_hash(algorithm)
+    for chunk in read_chunks(file_path, chunk_size, read_mode, mmap_limit, progress, cancel_event, timings):
+        hash_obj.update(chunk)
+    return hash_obj.hexdigest()
+
+
+def hash_file_multi(file_path, algorithms=MULTI_ALGORITHMS, chunk_size=None, parallel=False,
+                    read_mode="buffered", mmap_limit=MMAP_LIMIT, progress=None, cancel_event=None,
+                    timings=None):
+    """Calculate several digests of a file while reading it only once
+
+    Returns a dict mapping each algorithm name to its hex digest. With
+    parallel=True every chunk is fed to the hash objects on separate threads;
+    hashlib releases the GIL for large buffers, so this only pays off with
+    large chunk sizes.
+    """
+    hash_objs = {algorithm: new_hash(algorithm) for algorithm in algorithms}
+    chunks = read_chunks(file_path, chunk_size, read_mode, mmap_limit, progress, cancel_event, timings)
+    if parallel and len(hash_objs) > 1:
+        # Imported here: concurrent.futures (and logging) would slow every startup
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=len(hash_objs)) as executor:
+            for chunk in chunks:
+                # Wait for every digest before the buffer is refilled
+                list(executor.map(lambda h: h.update(chunk), hash_objs.values()))
+    else:
+        for chunk in chunks:
+            for hash_obj in hash_objs.values():
+                hash_obj.update(chunk)
+    return {algorithm: h.hexdigest() for algorithm, h in hash_objs.items()}
+
+
+def compute_digest(file_path, algorithm, read_mode="buffered", mmap_limit=MMAP_LIMIT,
+                   progress=None, cancel_event=None, timings=None, tree_workers=None):
+    """Hash a file with one algorithm name or a sequence of them
+
+    A single name returns a hex digest string, a list or tuple of names
+    returns the dict from hash_file_multi. Tree names such as "tree-sha256"
+    return the root digest from tree_hash.tree_hash, hashing the chunks on
+    tree_workers threads (one per core by default).
+    """
+    if isinstance(algorithm, str) and algorithm.startswith("tree-"):
+        # Imported here since tree_hash builds on this module
+        from tree_hash import tree_hash
+        return tree_hash(file_path, algorithm, workers=tree_workers, progress=progress,
+                         cancel_event=cancel_event, timings=timings).root
+    if isinstance(algorithm, (list, tuple)):
+        return hash_file_multi(file_path, algorithm, read_mode=read_mode, mmap_limit=mmap_limit,
+                               progress=progress, cancel_event=cancel_event, timings=timings)
+    return hash_file(file_path, algorithm, read_mode=read_mode, mmap_limit=mmap_limit,
+                     progress=progress, cancel_event=cancel_event, timings=timings)
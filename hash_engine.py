@@ -0,0 +1,307 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from hash_core import compute_digest, default_workers, MMAP_LIMIT, HashCancelled
+
+BACKENDS = ("thread", "process")
+# Order in which files are read: as given, or sorted per device by io_scheduler
+SCHEDULES = ("input", "device")
+
+# Files smaller than this are sent to the workers in groups
+SMALL_FILE_SIZE = 1024 * 1024
+# A group is closed once it holds this many bytes or files
+GROUP_BYTES = 16 * 1024 * 1024
+GROUP_FILES = 64
+# Tasks queued per worker before the engine waits for one to finish
+MAX_IN_FLIGHT = 4
+# Seconds between cancel checks while waiting for running tasks
+CANCEL_POLL = 0.2
+# Number of files looked up in the cache per transaction
+CACHE_BLOCK = 500
+
+
+def hash_group(items, algorithm, read_mode="buffered", mmap_limit=MMAP_LIMIT,
+               progress=None, cancel_event=None, telemetry=None, submitted=None):
+    """Hash a group of (index, path) items inside one worker task
+
+    Returns a list of (index, path, hash, error) tuples. A failing file does
+    not stop the rest of the group. When algorithm is a list of names the hash
+    is a dict of digests from a single read of the file. progress,
+    cancel_event and telemetry can only be used with the thread backend;
+    submitted is the time.monotonic() at which the task was queued.
+    """
+    results = []
+    queue_wait = time.monotonic() - submitted if submitted is not None else 0.0
+    for index, path in items:
+        try:
+            # The engine's workers already use every core: tree chunks are
+            # hashed on the worker's own thread
+            if telemetry is not None:
+                hash_value = telemetry.digest(path, compute_digest, path, algorithm, read_mode,
+                                              mmap_limit, progress, cancel_event, queue_wait=queue_wait,
+                                              tree_workers=1)
+            else:
+                hash_value = compute_digest(path, algorithm, read_mode, mmap_limit, progress, cancel_event,
+                                            tree_workers=1)
+            results.append((index, path, hash_value, None))
+        except HashCancelled:
+            raise
+        except Exception as e:
+            results.append((index, path, None, str(e)))
+    return results
+
+
+class HashEngine:
+    """Hash many files on a pool of worker threads or processes"""
+
+    def __init__(self, backend="thread", workers=None,
+                 small_file_size=SMALL_FILE_SIZE, group_bytes=GROUP_BYTES,
+                 group_files=GROUP_FILES, read_mode="buffered", mmap_limit=MMAP_LIMIT,
+                 cache=None, trust_cache=True, progress=None, cancel_event=None, telemetry=None,
+                 schedule="input", device_workers=None):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown hashing backend: {backend}")
+        if schedule not in SCHEDULES:
+            raise ValueError(f"Unknown schedule: {schedule}")
+        self.backend = backend
+        self.workers = max(1, int(workers or default_workers()))
+        self.small_file_size = small_file_size
+        self.group_bytes = group_bytes
+        self.group_files = group_files
+        self.read_mode = read_mode
+        self.mmap_limit = mmap_limit
+        # Optional HashCache consulted before any file is read; with
+        # trust_cache=False every file is rehashed and the cache refreshed
+        self.cache = cache
+        self.trust_cache = trust_cache
+        # progress is called with byte counts as data is hashed: per chunk
+        # with the thread backend, per finished file with processes and for
+        # cached files. Setting cancel_event stops the run with HashCancelled.
+        self.progress = progress
+        self.cancel_event = cancel_event
+        # Optional telemetry.Telemetry: per-file timings with threads, per
+        # task totals with processes
+        self.telemetry = telemetry
+        # "device" reads each device's files in disk order with a
+        # concurrency limit per device; device_workers overrides the limit
+        self.schedule = schedule
+        self.device_workers = device_workers
+
+    def make_executor(self):
+        """Create the executor for the configured backend"""
+        if self.backend == "process":
+            # Loads multiprocessing, so only when the process backend is used
+            from concurrent.futures import ProcessPoolExecutor
+            return ProcessPoolExecutor(max_workers=self.workers)
+        return ThreadPoolExecutor(max_workers=self.workers)
+
+    def make_groups(self, items):
+        """Turn stat_files output into ("hash", group) and ("done", result) tasks
+
+        Small files are grouped together; each group is a list of
+        (index, path) pairs. Cached results pass straight through.
+        """
+        group = []
+        group_size = 0
+        for kind, item in items:
+            if kind == "done":
+                yield kind, item
+                continue
+            index, path, st = item
+            # Files that cannot be stat'ed are left for the worker to report
+            size = st.st_size if st is not None else 0
+            if size >= self.small_file_size:
+                yield "hash", [(index, path)]
+                continue
+            group.append((index, path))
+            group_size += size
+            if group_size >= self.group_bytes or len(group) >= self.group_files:
+                yield "hash", group
+                group = []
+                group_size = 0
+        if group:
+            yield "hash", group
+
+    def stat_files(self, files, algorithm, stats):
+        """Stat files and look them up in the cache
+
+        Yields ("hash", (index, path, stat)) for files still to hash, keeping
+        their stat in stats, and ("done", result) for cache hits. files may
+        be any iterable and is consumed lazily.
+        """
+        block = []
+        for index, path in enumerate(files):
+            try:
+                st = os.stat(path)
+            except OSError:
+                st = None
+            if self.cache is None or not self.trust_cache or st is None:
+                stats[index] = st
+                yield "hash", (index, path, st)
+                continue
+            block.append((index, path, st))
+            if len(block) >= CACHE_BLOCK:
+                yield from self.check_cache(block, algorithm, stats)
+                block = []
+        if block:
+            yield from self.check_cache(block, algorithm, stats)
+
+    def check_cache(self, block, algorithm, stats):
+        """Look up a block of (index, path, stat) items in the cache"""
+        cached = self.cache.lookup_many([(path, st) for _, path, st in block], algorithm)
+        for (index, path, st), hash_value in zip(block, cached):
+            if hash_value is None:
+                stats[index] = st
+                yield "hash", (index, path, st)
+            else:
+                if self.progress is not None:
+                    self.progress(st.st_size)
+                yield "done", (index, path, hash_value, None)
+
+    def finish(self, future, algorithm, stats, submitted=None):
+        """Return the results of a finished task, storing them in the cache"""
+        results = future.result()
+        started = submitted.pop(future, None) if submitted is not None else None
+        if self.telemetry is not None and self.backend == "process" and started is not None:
+            # Worker processes cannot share the telemetry, so record the task
+            self.telemetry.task(len(results),
+                                sum(stats[index].st_size for index, _, _, _ in results
+                                    if stats.get(index) is not None),
+                                time.monotonic() - started, 0.0)
+        if self.progress is not None and self.backend == "process":
+            self.progress(sum(stats[index].st_size for index, _, hash_value, _ in results
+                              if hash_value is not None and stats.get(index) is not None))
+        if self.cache is not None:
+            self.cache.store_many([(path, hash_value, stats[index])
+                                   for index, path, hash_value, error in results
+                                   if hash_value is not None], algorithm)
+        for index, _, _, _ in results:
+            stats.pop(index, None)
+        return results
+
+    def submit(self, executor, group, algorithm, submitted):
+        """Queue hash_group for a group of (index, path) items"""
+        if self.backend == "thread":
+            # Threads report progress per chunk and can stop mid-file
+            future = executor.submit(hash_group, group, algorithm, self.read_mode, self.mmap_limit,
+                                     self.progress, self.cancel_event, self.telemetry,
+                                     submitted=time.monotonic())
+        else:
+            future = executor.submit(hash_group, group, algorithm, self.read_mode, self.mmap_limit)
+        submitted[future] = time.monotonic()
+        return future
+
+    def hash_files(self, files, algorithm):
+        """Yield (index, path, hash, error) tuples as files complete
+
+        files may be a generator such as file_scanner.scan_tree; it is consumed
+        while hashing runs and at most MAX_IN_FLIGHT tasks per worker are
+        queued at a time, so hashing starts on the first file found. With a
+        cache, files whose digests are cached are not read at all and new
+        digests are stored as they come in.
+        """
+        if self.schedule == "device":
+            yield from self.hash_scheduled(files, algorithm)
+            return
+        stats = {}
+        max_in_flight = self.workers * MAX_IN_FLIGHT
+        executor = self.make_executor()
+        in_flight = set()
+        submitted = {}
+        try:
+            for kind, item in self.make_groups(self.stat_files(files, algorithm, stats)):
+                self.check_cancelled()
+                if kind == "done":
+                    yield item
+                    continue
+                in_flight.add(self.submit(executor, item, algorithm, submitted))
+                while len(in_flight) >= max_in_flight:
+                    # Polled, as the process backend's workers cannot see cancel_event
+                    self.check_cancelled()
+                    done, in_flight = wait(in_flight, timeout=CANCEL_POLL, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield from self.finish(future, algorithm, stats, submitted)
+            while in_flight:
+                self.check_cancelled()
+                done, in_flight = wait(in_flight, timeout=CANCEL_POLL, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield from self.finish(future, algorithm, stats, submitted)
+        except BaseException:
+            # Cancelled or abandoned: drop queued tasks and do not wait for
+            # the running ones
+            for future in in_flight:
+                future.cancel()
+            executor.shutdown(wait=False)
+            raise
+        executor.shutdown()
+
+    def hash_scheduled(self, files, algorithm):
+        """hash_files for schedule="device"
+
+        Up to io_scheduler.SCHEDULE_WINDOW files are stat'ed ahead and
+        queued per device; a DeviceScheduler decides which device's files
+        run next, so exactly one task per worker is in the executor at a
+        time and the per-device limits hold.
+        """
+        from io_scheduler import DeviceScheduler, SCHEDULE_WINDOW
+        scheduler = DeviceScheduler(self.workers, self.device_workers, self.small_file_size,
+                                    self.group_bytes, self.group_files)
+        stats = {}
+        items = self.stat_files(files, algorithm, stats)
+        exhausted = False
+        executor = self.make_executor()
+        running = {}  # future -> scheduler task
+        submitted = {}
+        try:
+            while True:
+                self.check_cancelled()
+                while not exhausted and scheduler.queued < SCHEDULE_WINDOW:
+                    next_item = next(items, None)
+                    if next_item is None:
+                        exhausted = True
+                    elif next_item[0] == "done":
+                        yield next_item[1]
+                    else:
+                        scheduler.add(*next_item[1])
+                while len(running) < self.workers:
+                    task = scheduler.next_task()
+                    if task is None:
+                        break
+                    running[self.submit(executor, task[1], algorithm, submitted)] = task
+                if not running:
+                    # Only possible once every file has been handed out
+                    break
+                done, _ = wait(running, timeout=CANCEL_POLL, return_when=FIRST_COMPLETED)
+                for future in done:
+                    scheduler.done(running.pop(future))
+                    yield from self.finish(future, algorithm, stats, submitted)
+        except BaseException:
+            for future in running:
+                future.cancel()
+            executor.shutdown(wait=False)
+            raise
+        executor.shutdown()
+
+    def check_cancelled(self):
+        """Raise HashCancelled if the cancel event is set"""
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise HashCancelled()
+
+    def hash_ordered(self, files, algorithm):
+        """Yield (index, path, hash, error) tuples in input order
+
+        Results that complete early wait in a buffer until every earlier file
+        is done, so one slow file can hold back the ones after it.
+        """
+        waiting = {}
+        next_index = 0
+        for result in self.hash_files(files, algorithm):
+            waiting[result[0]] = result
+            while next_index in waiting:
+                yield waiting.pop(next_index)
+                next_index += 1
+
+    def hash_all(self, files, algorithm):
+        """Hash all files and return the results in input order"""
+        return list(self.hash_ordered(files, algorithm))
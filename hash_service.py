@@ -0,0 +1,410 @@
+"""Local hashing service
+
+Several tools asking for digests at once would otherwise each start their
+own process and read the same files again. HashService keeps one process
+running with the digest cache open and answers HTTP requests on a Unix
+socket, or on 127.0.0.1 where Unix sockets are not available:
+
+    GET /hash?path=FILE&algorithm=sha256[&rehash=1]
+    POST /hash  {"path": FILE, "algorithm": "sha256", "rehash": false}
+    GET /status
+
+The requests are read by an asyncio event loop and the files are hashed on
+a bounded pool of worker threads. A request for a file and algorithm that
+is already being hashed waits for that job instead of starting another
+one. Once max_pending jobs are queued or running, new jobs are refused
+with 503 and a Retry-After header until the workers catch up.
+
+ServiceClient is a small blocking client for scripts and tests.
+"""
+import asyncio
+import http.client
+import json
+import os
+import signal
+import socket
+import sqlite3
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qs
+
+from hash_core import default_workers, HashCancelled
+from hash_cache import HashCache, cached_digest, default_cache_path, default_log_dir
+
+# Default socket file inside the log directory
+SOCKET_FILE = "hash_service.sock"
+# TCP port used where Unix sockets are not available
+DEFAULT_PORT = 8765
+# Jobs queued or running per worker before requests are refused
+PENDING_PER_WORKER = 16
+# Largest request body accepted, in bytes
+MAX_BODY = 64 * 1024
+# Seconds a refused client is asked to wait, and how often ServiceClient retries
+RETRY_AFTER = 1
+CLIENT_RETRIES = 30
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           500: "Internal Server Error", 503: "Service Unavailable"}
+
+
+def unix_sockets_supported():
+    """Return True if asyncio can serve on a Unix socket here"""
+    return hasattr(socket, 'AF_UNIX') and os.name != 'nt'
+
+
+def default_address():
+    """Return the socket path, or the port, the service uses by default"""
+    if unix_sockets_supported():
+        return os.path.join(default_log_dir(), SOCKET_FILE)
+    return DEFAULT_PORT
+
+
+def remove_stale_socket(path):
+    """Delete a socket file left behind by a service that is not running
+
+    Raises OSError if another service is still listening on it.
+    """
+    if not os.path.exists(path):
+        return
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except (ConnectionRefusedError, FileNotFoundError):
+        os.remove(path)
+        return
+    finally:
+        probe.close()
+    raise OSError(f"a hash service is already listening on {path}")
+
+
+class ServiceError(Exception):
+    """A request the service answered with an error"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class HashService:
+    """asyncio front end of a bounded pool of hashing threads"""
+
+    def __init__(self, address=None, workers=None, max_pending=None, cache=None,
+                 read_mode="buffered", log=None):
+        self.address = default_address() if address is None else address
+        self.workers = max(1, int(workers or default_workers()))
+        self.max_pending = max_pending or self.workers * PENDING_PER_WORKER
+        # Shared HashCache, or None to always read the files
+        self.cache = cache
+        self.read_mode = read_mode
+        self.log = log
+        self.executor = None
+        self.server = None
+        # (path, algorithm, trust_cache) -> future of the job hashing it
+        self.in_flight = {}
+        self.stats = dict.fromkeys(("requests", "hashed", "coalesced", "refused", "errors"), 0)
+        self.started = time.time()
+
+    def describe_address(self):
+        """Return the address in the form ServiceClient and the CLI accept"""
+        if isinstance(self.address, int):
+            return f"127.0.0.1:{self.address}"
+        return self.address
+
+    async def start(self):
+        """Open the worker pool and start listening"""
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="hash-service")
+        if isinstance(self.address, int):
+            self.server = await asyncio.start_server(self.handle, "127.0.0.1", self.address)
+        else:
+            remove_stale_socket(self.address)
+            self.server = await asyncio.start_unix_server(self.handle, self.address)
+            # Only the user running the service may ask it to read files
+            os.chmod(self.address, 0o600)
+        if self.log is not None:
+            self.log(f"hash service listening on {self.describe_address()} "
+                     f"with {self.workers} workers")
+
+    async def serve(self):
+        """Serve until cancelled by Ctrl+C through asyncio.run, or SIGTERM"""
+        await self.start()
+        loop = asyncio.get_running_loop()
+        try:
+            loop.add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+        except (NotImplementedError, AttributeError):
+            # No signal handlers in the Windows event loop
+            pass
+        try:
+            await self.server.serve_forever()
+        except asyncio.CancelledError:
+            pass
+        finally:
+            await self.stop()
+
+    async def stop(self):
+        """Stop listening, wait for running jobs and remove the socket file"""
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+        if not isinstance(self.address, int):
+            try:
+                os.remove(self.address)
+            except OSError:
+                pass
+
+    def digest(self, path, algorithm, trust_cache):
+        """Hash one file on a worker thread"""
+        return cached_digest(self.cache, path, algorithm, trust_cache, read_mode=self.read_mode)
+
+    async def hash(self, path, algorithm, rehash=False):
+        """Return (hash, coalesced), joining a job already hashing the file
+
+        Raises ServiceError(503) when max_pending jobs are waiting.
+        """
+        path = os.path.abspath(path)
+        trust_cache = not rehash
+        key = (path, tuple(algorithm) if isinstance(algorithm, list) else algorithm, trust_cache)
+        future = self.in_flight.get(key)
+        coalesced = future is not None
+        if coalesced:
+            self.stats['coalesced'] += 1
+        else:
+            if len(self.in_flight) >= self.max_pending:
+                self.stats['refused'] += 1
+                raise ServiceError(503, f"{len(self.in_flight)} jobs pending, try again later")
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(self.executor, self.digest, path, algorithm, trust_cache)
+            self.in_flight[key] = future
+            future.add_done_callback(lambda f: self.in_flight.pop(key, None))
+            self.stats['hashed'] += 1
+        # A client hanging up must not cancel a job other clients wait for
+        return await asyncio.shield(future), coalesced
+
+    async def handle(self, reader, writer):
+        """Answer the HTTP/1.1 requests of one connection"""
+        try:
+            while True:
+                request = await self.read_request(reader)
+                if request is None:
+                    break
+                method, target, headers, body = request
+                status, payload, extra = await self.dispatch(method, target, body)
+                keep_alive = headers.get("connection", "").lower() != "close"
+                self.write_response(writer, status, payload, extra, keep_alive)
+                # Waits while the client is slow to read its answers
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ValueError as e:
+            # Malformed request line, header or body size
+            self.write_response(writer, 400, {'error': str(e)}, {}, False)
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            pass
+        except asyncio.CancelledError:
+            # The service is stopping while the client keeps the connection open
+            pass
+        finally:
+            writer.close()
+
+    async def read_request(self, reader):
+        """Read one request; returns None at the end of the connection"""
+        line = await reader.readline()
+        if not line.strip():
+            return None
+        method, target, _ = line.decode('latin-1').split(None, 2)
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode('latin-1').partition(":")
+            headers[name.strip().lower()] = value.strip()
+        length = int(headers.get("content-length") or 0)
+        if length > MAX_BODY:
+            raise ValueError("request body too large")
+        body = await reader.readexactly(length) if length else b""
+        return method.upper(), target, headers, body
+
+    def write_response(self, writer, status, payload, extra, keep_alive):
+        """Write a JSON response"""
+        body = (json.dumps(payload) + "\n").encode('utf-8')
+        head = [f"HTTP/1.1 {status} {REASONS.get(status, 'Error')}",
+                "Content-Type: application/json",
+                f"Content-Length: {len(body)}",
+                f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+        head.extend(f"{name}: {value}" for name, value in extra.items())
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode('latin-1') + body)
+
+    async def dispatch(self, method, target, body):
+        """Return (status, payload, extra headers) for a request"""
+        self.stats['requests'] += 1
+        url = urlsplit(target)
+        if url.path == "/status":
+            return 200, self.status(), {}
+        if url.path != "/hash":
+            return 404, {'error': f"unknown endpoint {url.path}"}, {}
+        if method == "GET":
+            query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+            request = {'path': query.get('path'), 'algorithm': query.get('algorithm', "sha256"),
+                       'rehash': query.get('rehash', "0") not in ("0", "false", "")}
+        elif method == "POST":
+            try:
+                request = json.loads(body or b"{}")
+            except ValueError:
+                return 400, {'error': "request body is not JSON"}, {}
+            if not isinstance(request, dict):
+                return 400, {'error': "request body must be a JSON object"}, {}
+        else:
+            return 405, {'error': f"{method} is not supported"}, {}
+
+        path = request.get('path')
+        if not path or not isinstance(path, str):
+            return 400, {'error': "no path given"}, {}
+        try:
+            algorithm = self.parse_algorithm(request.get('algorithm', "sha256"))
+            hash_value, coalesced = await self.hash(path, algorithm, bool(request.get('rehash')))
+        except ServiceError as e:
+            return e.status, {'error': str(e)}, {"Retry-After": RETRY_AFTER} if e.status == 503 else {}
+        except ValueError as e:
+            return 400, {'error': str(e)}, {}
+        except FileNotFoundError as e:
+            self.stats['errors'] += 1
+            return 404, {'path': path, 'error': str(e)}, {}
+        except (OSError, HashCancelled, sqlite3.Error) as e:
+            self.stats['errors'] += 1
+            return 500, {'path': path, 'error': str(e)}, {}
+        return 200, {'path': os.path.abspath(path), 'algorithm': algorithm, 'hash': hash_value,
+                     'coalesced': coalesced}, {}
+
+    def parse_algorithm(self, algorithm):
+        """Check an algorithm name, a comma separated list or a JSON list"""
+        # Imported here: hash_cli pulls in every command's module
+        from hash_cli import parse_algorithm
+        if isinstance(algorithm, list) and all(isinstance(name, str) for name in algorithm):
+            algorithm = ",".join(algorithm)
+        if not isinstance(algorithm, str):
+            raise ValueError("algorithm must be a name or a list of names")
+        return parse_algorithm(algorithm)
+
+    def status(self):
+        """Describe the service and its counters"""
+        return {'address': self.describe_address(), 'workers': self.workers,
+                'max_pending': self.max_pending, 'pending': len(self.in_flight),
+                'cache': self.cache.db_path if self.cache is not None else None,
+                'uptime': round(time.time() - self.started, 1), **self.stats}
+
+
+def run_service(address=None, workers=None, max_pending=None, cache_path=None, read_mode="buffered"):
+    """Run a HashService until Ctrl+C, with the GUI's cache unless cache_path is False"""
+    cache = None
+    if cache_path is not False:
+        path = cache_path or default_cache_path()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        cache = HashCache(path)
+    service = HashService(address, workers, max_pending, cache, read_mode,
+                          log=lambda message: print(message, file=sys.stderr, flush=True))
+    try:
+        asyncio.run(service.serve())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if cache is not None:
+            cache.close()
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTPConnection over a Unix socket"""
+
+    def __init__(self, path, timeout=None):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = path
+
+    def connect(self):
+        """Connect to the socket file instead of a host and port"""
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not None:
+            self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+def parse_address(text):
+    """Turn "PORT", "HOST:PORT" or a socket path into (host or path, port)"""
+    if text is None:
+        address = default_address()
+        return ("127.0.0.1", address) if isinstance(address, int) else (address, None)
+    if text.isdigit():
+        return "127.0.0.1", int(text)
+    host, _, port = text.rpartition(":")
+    if host and port.isdigit() and os.sep not in text:
+        return host, int(port)
+    return text, None
+
+
+class ServiceClient:
+    """Blocking client of a HashService, keeping one connection open
+
+    Requests refused with 503 are retried after the Retry-After delay, up
+    to retries times, so a busy service slows its clients down instead of
+    failing them.
+    """
+
+    def __init__(self, address=None, timeout=None, retries=CLIENT_RETRIES):
+        self.host, self.port = parse_address(address)
+        self.timeout = timeout
+        self.retries = retries
+        self.conn = None
+
+    def connect(self):
+        """Create a connection to the service's socket or port"""
+        if self.port is None:
+            return UnixHTTPConnection(self.host, self.timeout)
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def request(self, method, target, payload=None):
+        """Send a request and return the decoded JSON answer
+
+        Raises ServiceError for error answers and OSError when the service
+        cannot be reached.
+        """
+        body = json.dumps(payload).encode('utf-8') if payload is not None else None
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        for attempt in range(self.retries + 1):
+            if self.conn is None:
+                self.conn = self.connect()
+            try:
+                self.conn.request(method, target, body, headers)
+                response = self.conn.getresponse()
+                data = response.read()
+            except (http.client.HTTPException, ConnectionError):
+                # The service closed the kept-alive connection; open a new one
+                self.close()
+                if attempt == self.retries:
+                    raise
+                continue
+            answer = json.loads(data or b"{}")
+            if response.status == 503 and attempt < self.retries:
+                time.sleep(float(response.getheader("Retry-After") or RETRY_AFTER))
+                continue
+            if response.status != 200:
+                raise ServiceError(response.status, answer.get('error', response.reason))
+            return answer
+        raise ServiceError(503, "service busy")
+
+    def hash(self, path, algorithm="sha256", rehash=False):
+        """Return the service's answer for one file: path, algorithm, hash, coalesced"""
+        return self.request("POST", "/hash", {'path': os.path.abspath(path), 'algorithm': algorithm,
+                                              'rehash': rehash})
+
+    def status(self):
+        """Return the service's counters"""
+        return self.request("GET", "/status")
+
+    def close(self):
+        """Close the kept-alive connection"""
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
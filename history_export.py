@@ -0,0 +1,270 @@
+"""Streaming export of the verification history
+
+Each exporter takes an iterator of history entries, such as
+HistoryStore.entries, and writes them to a binary file CHUNK_ROWS entries
+at a time, so exporting a very large history does not hold it in memory.
+reportlab keeps the finished pages of a PDF, compressed, until the file is
+saved; the other formats use constant memory.
+
+export_history writes to a temporary file next to the destination and
+only replaces the destination once the export is complete.
+"""
+import html
+import io
+import json
+import os
+
+from hash_core import HashCancelled
+
+# Entries formatted before each write
+CHUNK_ROWS = 1000
+
+HTML_HEADER = """<html>
+<head>
+    <style>
+        body { font-family: Arial, sans-serif; margin: 20px; }
+        table { border-collapse: collapse; width: 100%; }
+        th, td { border: 1px solid #ddd; padding: 8px; text-align: left; }
+        th { background-color: #f2f2f2; }
+        tr:nth-child(even) { background-color: #f9f9f9; }
+        .valid { color: green; font-weight: bold; }
+        .invalid { color: red; font-weight: bold; }
+        .hashed { color: #555; }
+    </style>
+</head>
+<body>
+    <h2>File Hash Verification History</h2>
+    <table>
+        <tr>
+            <th>Date</th>
+            <th>File</th>
+            <th>Algorithm</th>
+            <th>Hash (last 10)</th>
+            <th>Status</th>
+            <th>Compared Hash (last 10)</th>
+        </tr>
+"""
+HTML_FOOTER = """    </table>
+</body>
+</html>
+"""
+CSV_HEADER = ['Date', 'File', 'Algorithm', 'Hash (last 10)', 'Status', 'Compared Hash (last 10)',
+              'Chunk Size', 'Chunk Digests']
+
+
+def status_label(entry):
+    """Describe the outcome of a history entry"""
+    if entry['verified'] is None:
+        return "Hashed"
+    return "Valid Hash" if entry['verified'] else "Invalid Hash"
+
+
+def short_hash(value):
+    """Return the last 10 digits of a hash, as shown in exports"""
+    return value[-10:] if value else "N/A"
+
+
+def write_chunk(f, chunk, progress=None, cancel_event=None):
+    """Write formatted entries in one call and report them"""
+    if cancel_event is not None and cancel_event.is_set():
+        raise HashCancelled()
+    data = "".join(chunk).encode('utf-8')
+    f.write(data)
+    if progress is not None:
+        progress(len(chunk), len(data))
+
+
+def write_rows(f, entries, format_row, progress=None, cancel_event=None):
+    """Write format_row(entry) for every entry, CHUNK_ROWS at a time
+
+    progress(entries, bytes) is called after each write. Returns the
+    number of entries written.
+    """
+    count = 0
+    chunk = []
+    for entry in entries:
+        chunk.append(format_row(entry))
+        if len(chunk) >= CHUNK_ROWS:
+            write_chunk(f, chunk, progress, cancel_event)
+            count += len(chunk)
+            chunk = []
+    if chunk:
+        write_chunk(f, chunk, progress, cancel_event)
+        count += len(chunk)
+    return count
+
+
+def export_html(entries, f, progress=None, cancel_event=None):
+    """Write entries as an HTML table"""
+    def format_row(entry):
+        if entry['verified'] is None:
+            status_class = "hashed"
+        else:
+            status_class = "valid" if entry['verified'] else "invalid"
+        return (f"        <tr>\n"
+                f"            <td>{html.escape(entry['date'])}</td>\n"
+                f"            <td>{html.escape(entry['file'])}</td>\n"
+                f"            <td>{html.escape(entry['algorithm'].upper())}</td>\n"
+                f"            <td>{html.escape(short_hash(entry['hash']))}</td>\n"
+                f"            <td class=\"{status_class}\">{status_label(entry)}</td>\n"
+                f"            <td>{html.escape(short_hash(entry['compared_hash']))}</td>\n"
+                f"        </tr>\n")
+
+    f.write(HTML_HEADER.encode('utf-8'))
+    count = write_rows(f, entries, format_row, progress, cancel_event)
+    f.write(HTML_FOOTER.encode('utf-8'))
+    return count
+
+
+def export_csv(entries, f, progress=None, cancel_event=None):
+    """Write entries as CSV, with the chunk digests of tree hashes"""
+    import csv
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def take_line():
+        line = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return line
+
+    def format_row(entry):
+        writer.writerow([
+            entry['date'],
+            entry['file'],
+            entry['algorithm'].upper(),
+            short_hash(entry['hash']),
+            status_label(entry),
+            short_hash(entry['compared_hash']),
+            entry.get('chunk_size', ''),
+            ' '.join(entry.get('chunks', []))
+        ])
+        return take_line()
+
+    writer.writerow(CSV_HEADER)
+    f.write(take_line().encode('utf-8'))
+    return write_rows(f, entries, format_row, progress, cancel_event)
+
+
+def export_json(entries, f, progress=None, cancel_event=None):
+    """Write entries as one JSON array, written element by element"""
+    first = True
+
+    def format_row(entry):
+        nonlocal first
+        separator = "\n" if first else ",\n"
+        first = False
+        return separator + json.dumps(entry, indent=4)
+
+    f.write(b"[")
+    count = write_rows(f, entries, format_row, progress, cancel_event)
+    f.write(b"\n]\n")
+    return count
+
+
+def export_jsonl(entries, f, progress=None, cancel_event=None):
+    """Write entries as JSON Lines, one object per line"""
+    return write_rows(f, entries, lambda entry: json.dumps(entry) + "\n", progress, cancel_event)
+
+
+def export_pdf(entries, f, progress=None, cancel_event=None):
+    """Write entries to a PDF, drawing one page at a time
+
+    The page is drawn straight on a reportlab canvas, so no flowables are
+    built up front. progress(entries, 0) is called after each page.
+    """
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib.units import inch
+    from reportlab.lib.utils import simpleSplit
+    from reportlab.pdfgen import canvas
+
+    width, height = letter
+    margin = 0.75 * inch
+    font, size, leading = "Helvetica", 10, 14
+    text_width = width - 2 * margin
+    pdf = canvas.Canvas(f, pagesize=letter, pageCompression=1)
+    pdf.setTitle("Hash Verification History")
+
+    pdf.setFont("Helvetica-Bold", 18)
+    pdf.drawString(margin, height - margin - 18, "Hash Verification History:")
+    y = height - margin - 18 - 0.25 * inch
+    count = 0
+    on_page = 0
+    for entry in entries:
+        lines = [(f"File: {os.path.basename(entry['file'])}", colors.black)]
+        lines.extend((line, colors.black) for line in simpleSplit(f"Path: {entry['file']}", font, size, text_width))
+        lines.append((f"Algorithm: {entry['algorithm'].upper()}", colors.black))
+        lines.append((f"Hash (last 10): {short_hash(entry['hash'])}", colors.black))
+        lines.append((f"Date: {entry['date']}", colors.black))
+        if entry['compared_hash']:
+            lines.append((f"Compared Hash (last 10): {short_hash(entry['compared_hash'])}", colors.black))
+        if entry['verified'] is None:
+            status_color = colors.black
+        else:
+            status_color = colors.green if entry['verified'] else colors.red
+        lines.append((f"Status: {status_label(entry)}", status_color))
+
+        if y - len(lines) * leading < margin:
+            pdf.showPage()
+            y = height - margin
+            count += on_page
+            if progress is not None:
+                progress(on_page, 0)
+            on_page = 0
+            if cancel_event is not None and cancel_event.is_set():
+                raise HashCancelled()
+        pdf.setFont(font, size)
+        for text, color in lines:
+            pdf.setFillColor(color)
+            pdf.drawString(margin, y - size, text)
+            y -= leading
+        y -= 0.1 * inch
+        on_page += 1
+
+    count += on_page
+    if not count:
+        pdf.setFont(font, size)
+        pdf.drawString(margin, y - size, "No verification history available.")
+    pdf.save()
+    if progress is not None and on_page:
+        progress(on_page, 0)
+    return count
+
+
+# Exporter and file extension of each format offered by the GUI and the CLI
+EXPORTERS = {
+    "html": export_html,
+    "pdf": export_pdf,
+    "csv": export_csv,
+    "json": export_json,
+    "jsonl": export_jsonl
+}
+
+
+def format_from_path(file_path):
+    """Return the export format matching a file's extension, or None"""
+    extension = os.path.splitext(file_path)[1].lower().lstrip('.')
+    return extension if extension in EXPORTERS else None
+
+
+def export_history(entries, file_path, format_type, progress=None, cancel_event=None):
+    """Export entries to file_path in one of EXPORTERS' formats
+
+    Returns the number of entries written. A failed or cancelled export
+    leaves any existing file_path untouched.
+    """
+    exporter = EXPORTERS[format_type]
+    temp_path = file_path + ".part"
+    try:
+        with open(temp_path, 'wb') as f:
+            count = exporter(entries, f, progress, cancel_event)
+        os.replace(temp_path, file_path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+    return count
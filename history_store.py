@@ -0,0 +1,203 @@
+"""Persistent verification history
+
+Every hash and verification is appended to an SQLite database in the log
+directory, so the history survives restarts and can be audited later.
+Entries are the dicts the GUI has always used ('file', 'hash',
+'algorithm', 'date', 'verified', 'compared_hash' and, for tree hashes,
+'chunk_size' and 'chunks'); 'verified' is None for files that were hashed
+without being checked against anything.
+
+Entries added from worker threads are buffered and written in batches.
+Reads page through the database by id, so even a very large history is
+never loaded into memory at once.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Default file name of the history database inside the log directory
+HISTORY_FILE = "history.sqlite3"
+# Oldest entries are deleted beyond this many entries; 0 keeps everything
+MAX_HISTORY = 1000000
+# Buffered entries are written once there are this many...
+FLUSH_SIZE = 500
+# ...or the oldest one has waited this many seconds
+FLUSH_INTERVAL = 1.0
+# How many writes happen between two retention checks
+PRUNE_INTERVAL = 1000
+# Entries read per query by entries()
+PAGE_SIZE = 1000
+
+# Values of the status column
+STATUS_VALID = "valid"
+STATUS_INVALID = "invalid"
+STATUS_HASHED = "hashed"
+
+COLUMNS = "id, date, path, algorithm, digest, compared, status, chunk_size, chunks"
+
+
+def entry_status(entry):
+    """Return the status column value of a history entry"""
+    verified = entry.get('verified')
+    if verified is None:
+        return STATUS_HASHED
+    return STATUS_VALID if verified else STATUS_INVALID
+
+
+def entry_from_row(row):
+    """Turn a database row back into a history entry dict"""
+    _, date, path, algorithm, digest, compared, status, chunk_size, chunks = row
+    entry = {
+        'file': path,
+        'hash': digest,
+        'algorithm': algorithm,
+        'date': date,
+        'verified': None if status == STATUS_HASHED else status == STATUS_VALID,
+        'compared_hash': compared
+    }
+    if chunk_size is not None:
+        entry['chunk_size'] = chunk_size
+        entry['chunks'] = json.loads(chunks)
+    return entry
+
+
+class HistoryStore:
+    """Append-only history of verifications in an SQLite database
+
+    The store is safe to share between threads. Reads see every entry
+    added before them, buffered ones included.
+    """
+
+    def __init__(self, db_path, max_entries=MAX_HISTORY):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.pending = []
+        self.pending_since = None
+        self.writes = 0
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS history (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    date TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    algorithm TEXT NOT NULL,
+                    digest TEXT NOT NULL,
+                    compared TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    chunk_size INTEGER,
+                    chunks TEXT
+                )
+            """)
+            for column in ("date", "path", "digest", "status"):
+                self.conn.execute(f"CREATE INDEX IF NOT EXISTS history_{column} ON history ({column})")
+
+    def add(self, entry):
+        """Queue an entry; it is written with the next batch"""
+        self.add_many([entry])
+
+    def add_many(self, entries):
+        """Queue several entries, writing the batch once it is big or old enough"""
+        rows = [(entry['date'], os.path.abspath(entry['file']), entry['algorithm'], (entry['hash'] or "").lower(),
+                 (entry['compared_hash'] or "").lower(), entry_status(entry), entry.get('chunk_size'),
+                 json.dumps(entry['chunks']) if entry.get('chunks') else None)
+                for entry in entries]
+        with self.lock:
+            if not self.pending:
+                self.pending_since = time.monotonic()
+            self.pending.extend(rows)
+            if (len(self.pending) >= FLUSH_SIZE
+                    or time.monotonic() - self.pending_since >= FLUSH_INTERVAL):
+                self.write_pending()
+
+    def flush(self):
+        """Write the queued entries now"""
+        with self.lock:
+            self.write_pending()
+
+    def write_pending(self):
+        """Insert the queued entries in one transaction; call with the lock held"""
+        if not self.pending:
+            return
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO history (date, path, algorithm, digest, compared, status, chunk_size, chunks) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", self.pending)
+            self.writes += len(self.pending)
+            self.pending = []
+            if self.writes >= PRUNE_INTERVAL:
+                self.writes = 0
+                self.prune()
+
+    def prune(self):
+        """Delete the oldest entries beyond max_entries
+
+        Must be called with the lock held inside a transaction.
+        """
+        if not self.max_entries:
+            return
+        newest = self.conn.execute("SELECT MAX(id) FROM history").fetchone()[0]
+        if newest is not None and newest > self.max_entries:
+            self.conn.execute("DELETE FROM history WHERE id <= ?", (newest - self.max_entries,))
+
+    def where(self, path=None, digest=None, status=None):
+        """Return the WHERE clause and parameters of a query"""
+        conditions = []
+        params = []
+        for column, value in (("path", path), ("digest", digest), ("status", status)):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                if column == "path":
+                    value = os.path.abspath(value)
+                params.append(value.lower() if column == "digest" else value)
+        return (" WHERE " + " AND ".join(conditions)) if conditions else "", params
+
+    def count(self, **filters):
+        """Return how many entries match path=, digest= and status= filters"""
+        clause, params = self.where(**filters)
+        with self.lock:
+            self.write_pending()
+            return self.conn.execute(f"SELECT COUNT(*) FROM history{clause}", params).fetchone()[0]
+
+    def entries(self, newest_first=True, limit=None, page_size=PAGE_SIZE, **filters):
+        """Yield matching history entries, page_size rows per query
+
+        Filters are path=, digest= (e.g. every verification of a digest)
+        and status= (STATUS_VALID, STATUS_INVALID or STATUS_HASHED). Pages
+        continue from the last id seen, so each query uses the primary key
+        however far into the history it is.
+        """
+        clause, params = self.where(**filters)
+        order = "DESC" if newest_first else "ASC"
+        last_id = None
+        remaining = limit
+        while remaining is None or remaining > 0:
+            size = page_size if remaining is None else min(page_size, remaining)
+            query = f"SELECT {COLUMNS} FROM history{clause}"
+            page_params = list(params)
+            if last_id is not None:
+                query += (" AND " if clause else " WHERE ") + ("id < ?" if newest_first else "id > ?")
+                page_params.append(last_id)
+            query += f" ORDER BY id {order} LIMIT ?"
+            page_params.append(size)
+            with self.lock:
+                self.write_pending()
+                rows = self.conn.execute(query, page_params).fetchall()
+            for row in rows:
+                yield entry_from_row(row)
+            if len(rows) < size:
+                return
+            last_id = rows[-1][0]
+            if remaining is not None:
+                remaining -= len(rows)
+
+    def close(self):
+        """Write the queued entries and close the database"""
+        with self.lock:
+            self.write_pending()
+            self.conn.close()
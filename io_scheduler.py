@@ -0,0 +1,232 @@
+"""Device-aware ordering of batch work
+
+Hashing files in the order a dialog or a scan returned them makes a
+spinning disk seek between every file, and when the files live on several
+devices one slow device holds up the workers while the others sit idle.
+DeviceScheduler groups the files by st_dev, sorts each device's files by
+their position on disk and hands out work so that:
+
+- each device gets its own concurrency limit: one reader on rotational
+  disks, so they read sequentially, and a fair share of the workers on
+  everything else, so a slow network mount cannot occupy all of them;
+- every device reads in one sweep from low to high positions, and new
+  files added during the run join the sweep instead of restarting it;
+- devices that can run several reads at once get large files and groups
+  of small files alternately, so the per-file overhead of the small files
+  overlaps with the bandwidth-bound reads of the large ones.
+
+The position of a file is the physical offset of its first extent where
+Linux reports it (FIEMAP), otherwise its inode number, which on most
+filesystems follows allocation order.
+"""
+import bisect
+import os
+import struct
+import sys
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Concurrent reads per rotational disk
+ROTATIONAL_WORKERS = 1
+# Files stat'ed and sorted ahead of the workers
+SCHEDULE_WINDOW = 10000
+
+# FS_IOC_FIEMAP request for the first extent of a file
+FS_IOC_FIEMAP = 0xC020660B
+FIEMAP_HEADER = struct.Struct("=QQIIII")
+FIEMAP_EXTENT_SIZE = 56
+
+
+def is_rotational(dev):
+    """Return True for spinning disks, False for SSDs, None when unknown
+
+    Only Linux reports this, through /sys/dev/block; for a partition the
+    value of its disk is used. Network and virtual filesystems have no
+    block device and return None.
+    """
+    if not sys.platform.startswith("linux"):
+        return None
+    base = f"/sys/dev/block/{os.major(dev)}:{os.minor(dev)}"
+    for path in (base + "/queue/rotational", base + "/../queue/rotational"):
+        try:
+            with open(path, 'r') as f:
+                return f.read().strip() == "1"
+        except OSError:
+            continue
+    return None
+
+
+def physical_offset(path):
+    """Return the disk offset of the first extent of a file, or None"""
+    if fcntl is None or not sys.platform.startswith("linux"):
+        return None
+    request = bytearray(FIEMAP_HEADER.pack(0, 0xFFFFFFFFFFFFFFFF, 0, 0, 1, 0) + bytes(FIEMAP_EXTENT_SIZE))
+    try:
+        with open(path, 'rb') as f:
+            fcntl.ioctl(f.fileno(), FS_IOC_FIEMAP, request)
+    except OSError:
+        return None
+    mapped_extents = FIEMAP_HEADER.unpack_from(request)[3]
+    if not mapped_extents:
+        return None
+    # fe_physical follows fe_logical in the first extent
+    return struct.unpack_from("=Q", request, FIEMAP_HEADER.size + 8)[0]
+
+
+class Device:
+    """Queued files and running tasks of one device"""
+
+    def __init__(self, dev, limit, rotational):
+        self.dev = dev
+        self.limit = limit
+        self.rotational = rotational
+        # Sorted (position, index, path, size) entries
+        self.small = []
+        self.large = []
+        self.running = 0
+        self.running_large = 0
+        # Position reached by the current sweep
+        self.cursor = None
+
+    def queued(self):
+        """Return how many files are waiting"""
+        return len(self.small) + len(self.large)
+
+
+class DeviceScheduler:
+    """Per-device queues of files to hash, handed out as engine tasks
+
+    add() queues a file; next_task() returns the next (device, items,
+    large) task that a device with a free slot can run, where items is a
+    list of (index, path) pairs as taken by hash_engine.hash_group; done()
+    frees the task's slot. Not thread-safe: HashEngine calls it from the
+    thread that submits the tasks.
+    """
+
+    def __init__(self, workers, device_workers=None, small_file_size=1024 * 1024,
+                 group_bytes=16 * 1024 * 1024, group_files=64):
+        self.workers = workers
+        # Fixed limit per device instead of the detected one
+        self.device_workers = device_workers
+        self.small_file_size = small_file_size
+        self.group_bytes = group_bytes
+        self.group_files = group_files
+        self.devices = {}
+        self.order = []  # Device keys in round-robin order
+        self.turn = 0
+        self.queued = 0
+
+    def device(self, dev):
+        """Return the Device of an st_dev, detecting its kind once"""
+        device = self.devices.get(dev)
+        if device is None:
+            rotational = is_rotational(dev) if dev is not None else None
+            if self.device_workers:
+                limit = self.device_workers
+            elif rotational:
+                limit = ROTATIONAL_WORKERS
+            else:
+                limit = self.workers
+            device = self.devices[dev] = Device(dev, limit, rotational)
+            self.order.append(dev)
+        return device
+
+    def add(self, index, path, st):
+        """Queue a file; st is its stat result, or None if stat failed"""
+        device = self.device(st.st_dev if st is not None else None)
+        offset = physical_offset(path) if device.rotational else None
+        if offset is not None:
+            position = (0, offset)
+        else:
+            position = (1, st.st_ino if st is not None else 0)
+        size = st.st_size if st is not None else 0
+        queue = device.large if size >= self.small_file_size else device.small
+        bisect.insort(queue, (position, index, path, size))
+        self.queued += 1
+
+    def share(self, device):
+        """Return how many tasks a device may run right now
+
+        Devices with work split the workers evenly, so a slow device keeps
+        at most its share while others have files waiting.
+        """
+        active = sum(1 for d in self.devices.values() if d.running or d.queued())
+        return min(device.limit, max(1, -(-self.workers // max(1, active))))
+
+    def next_task(self):
+        """Return the next (device, items, large) task, or None if none can start"""
+        for step in range(len(self.order)):
+            dev = self.order[(self.turn + step) % len(self.order)]
+            device = self.devices[dev]
+            if not device.queued() or device.running >= self.share(device):
+                continue
+            self.turn = (self.turn + step + 1) % len(self.order)
+            large = self.pick_large(device)
+            items = self.take(device, device.large if large else device.small, large)
+            device.running += 1
+            if large:
+                device.running_large += 1
+            self.queued -= len(items)
+            return device, items, large
+        return None
+
+    def pick_large(self, device):
+        """Decide whether a device's next task is a large file or small ones"""
+        if not device.large or not device.small:
+            return bool(device.large)
+        if device.limit == 1:
+            # Whichever comes first in the sweep, to keep the head moving one way
+            large = self.sweep_position(device, device.large)
+            small = self.sweep_position(device, device.small)
+            if large is None and small is None:
+                # Both wrap around to the start of the next sweep
+                return device.large[0][0] < device.small[0][0]
+            if large is None or small is None:
+                return small is None
+            return device.large[large][0] < device.small[small][0]
+        # Keep about half of the device's slots on large files
+        return device.running_large < max(1, self.share(device) // 2)
+
+    def sweep_position(self, device, queue):
+        """Return the index of the first entry at or after the cursor, or None"""
+        if device.cursor is None:
+            return 0 if queue else None
+        i = bisect.bisect_left(queue, (device.cursor,))
+        return i if i < len(queue) else None
+
+    def take(self, device, queue, large):
+        """Remove the next task's files from a queue, continuing the sweep"""
+        start = self.sweep_position(device, queue)
+        if start is None:
+            # End of the disk reached: start the next sweep
+            start = 0
+        if large:
+            end = start + 1
+        else:
+            # On a single-reader device the group ends at the next large file,
+            # which is read before the small files behind it
+            stop = None
+            if device.limit == 1 and device.large:
+                following = bisect.bisect_left(device.large, (queue[start][0],))
+                if following < len(device.large):
+                    stop = device.large[following][0]
+            end = start
+            total = 0
+            while (end < len(queue) and end - start < self.group_files and total < self.group_bytes
+                   and (stop is None or end == start or queue[end][0] < stop)):
+                total += queue[end][3]
+                end += 1
+        entries = queue[start:end]
+        del queue[start:end]
+        device.cursor = entries[-1][0]
+        return [(index, path) for _, index, path, _ in entries]
+
+    def done(self, task):
+        """Free the slot of a finished task"""
+        device, _, large = task
+        device.running -= 1
+        if large:
+            device.running_large -= 1
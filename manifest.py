@@ -0,0 +1,222 @@
+"""Checksum manifests compatible with sha256sum/md5sum -c
+
+Reads GNU lines ("<hash>  <name>", "<hash> *<name>") and BSD lines
+("SHA256 (<name>) = <hash>"), and writes GNU style manifests such as
+SHA256SUMS for a whole batch.
+"""
+import os
+import re
+
+from algorithms import ALGORITHMS
+from hash_engine import HashEngine
+from tree_hash import TREE_PREFIX
+
+# Manifest entry statuses
+OK = "OK"
+FAILED = "FAILED"
+MISSING = "MISSING"
+
+# Algorithm guessed from the length of a hex digest
+ALGORITHM_BY_LENGTH = {32: "md5", 40: "sha1", 56: "sha224", 64: "sha256", 96: "sha384", 128: "sha512"}
+# BSD tags of coreutils and openssl that do not name the algorithm as the
+# registry does, once lowercased with '-' turned into '_' (SHA3-256 -> sha3_256)
+TAG_ALGORITHMS = {
+    "sha2_224": "sha224", "sha2_256": "sha256", "sha2_384": "sha384", "sha2_512": "sha512",
+    "blake2b512": "blake2b", "blake2b_512": "blake2b",
+    "blake2s256": "blake2s", "blake2s_256": "blake2s",
+}
+
+GNU_LINE = re.compile(r'^(\\?)([0-9a-fA-F]+) ([ *])(.*)$')
+BSD_LINE = re.compile(r'^(\\?)([A-Za-z0-9_-]+) ?\((.*)\) ?= ?([0-9a-fA-F]+)$')
+
+
+class ManifestEntry:
+    """One line of a checksum manifest"""
+
+    def __init__(self, line_no, algorithm, name, expected):
+        self.line_no = line_no
+        self.algorithm = algorithm
+        self.name = name
+        self.expected = expected.lower()
+        self.path = None  # Set to the file's location by read_manifest
+
+
+def unescape_name(name):
+    """Undo the escaping GNU tools apply to names with backslashes or newlines"""
+    return name.replace('\\\\', '\0').replace('\\n', '\n').replace('\0', '\\')
+
+
+def escape_name(name):
+    """Escape a name the way GNU tools do; returns (prefix, name)"""
+    if '\\' in name or '\n' in name:
+        return '\\', name.replace('\\', '\\\\').replace('\n', '\\n')
+    return '', name
+
+
+def algorithm_from_tag(tag):
+    """Return the algorithm name of a BSD tag such as SHA256, SHA3-256 or BLAKE2b"""
+    name = tag.lower().replace('-', '_')
+    tree_tag = TREE_PREFIX.replace('-', '_')
+    if name.startswith(tree_tag):
+        # TREE-SHA256 -> tree-sha256
+        return TREE_PREFIX + algorithm_from_tag(name[len(tree_tag):])
+    return TAG_ALGORITHMS.get(name, name)
+
+
+def algorithm_from_manifest_name(manifest_path):
+    """Guess the algorithm from names like SHA256SUMS, TREE-SHA256SUMS, md5sum.txt or x.sha1"""
+    name = os.path.basename(manifest_path).lower().replace('-', '_')
+    # Longest first, so a name matches its most specific algorithm
+    for algorithm in sorted(set(ALGORITHMS) | set(ALGORITHM_BY_LENGTH.values()), key=len, reverse=True):
+        for tag in (TREE_PREFIX.replace('-', '_') + algorithm, algorithm):
+            if name.startswith(tag) or name.endswith("." + tag):
+                return algorithm_from_tag(tag)
+    return None
+
+
+def parse_line(line, line_no=0, algorithm=None):
+    """Parse one manifest line, returning a ManifestEntry or None
+
+    Blank lines and comments return None; lines in neither format raise
+    ValueError. For GNU lines without an algorithm it is guessed from the
+    length of the digest.
+    """
+    line = line.rstrip('\r\n')
+    if not line.strip() or line.lstrip().startswith('#'):
+        return None
+    match = BSD_LINE.match(line)
+    if match:
+        escaped, name_alg, name, digest = match.groups()
+        alg = algorithm_from_tag(name_alg)
+        if escaped:
+            name = unescape_name(name)
+        return ManifestEntry(line_no, alg, name, digest)
+    match = GNU_LINE.match(line)
+    if match:
+        escaped, digest, _, name = match.groups()
+        alg = algorithm or ALGORITHM_BY_LENGTH.get(len(digest))
+        if alg is None:
+            raise ValueError(f"line {line_no}: cannot tell the algorithm of a {len(digest)} digit hash")
+        if escaped:
+            name = unescape_name(name)
+        return ManifestEntry(line_no, alg, name, digest)
+    raise ValueError(f"line {line_no}: improperly formatted checksum line")
+
+
+def read_manifest(manifest_path, algorithm=None, errors=None):
+    """Yield the entries of a manifest file
+
+    Names are resolved relative to the manifest's directory. Badly formatted
+    lines are appended to errors (if given) and skipped.
+    """
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    algorithm = algorithm or algorithm_from_manifest_name(manifest_path)
+    with open(manifest_path, 'r', encoding='utf-8', errors='surrogateescape') as f:
+        for line_no, line in enumerate(f, 1):
+            try:
+                entry = parse_line(line, line_no, algorithm)
+            except ValueError as e:
+                if errors is not None:
+                    errors.append(f"{manifest_path}: {e}")
+                continue
+            if entry is not None:
+                entry.path = os.path.join(base_dir, entry.name)
+                yield entry
+
+
+def verify_manifest(manifest_path, algorithm=None, engine=None, errors=None):
+    """Hash every file listed in a manifest in parallel
+
+    Yields (entry, status, actual_hash, error) in manifest order, where
+    status is OK, FAILED or MISSING. All files are read once even when the
+    manifest mixes algorithms.
+    """
+    engine = engine or HashEngine()
+    entries = list(read_manifest(manifest_path, algorithm, errors))
+    algorithms = sorted({entry.algorithm for entry in entries})
+    if not algorithms:
+        return
+    hash_algorithm = algorithms[0] if len(algorithms) == 1 else algorithms
+    results = engine.hash_ordered((entry.path for entry in entries), hash_algorithm)
+    for entry, (index, path, hash_value, error) in zip(entries, results):
+        if hash_value is None:
+            status = MISSING if not os.path.lexists(path) else FAILED
+            yield entry, status, None, error
+            continue
+        actual = hash_value[entry.algorithm] if isinstance(hash_value, dict) else hash_value
+        yield entry, OK if actual.lower() == entry.expected else FAILED, actual, None
+
+
+def manifest_name(algorithm):
+    """Return the conventional manifest file name, e.g. SHA256SUMS"""
+    return f"{algorithm.upper()}SUMS"
+
+
+def write_sidecars(file_path, hash_value, algorithm):
+    """Write FILE.<algorithm> files holding "<hash> *<name>" next to a file
+
+    hash_value is a hex digest, or a dict of digests for several
+    algorithms, which get one file each. Returns the paths written.
+    """
+    digests = hash_value if isinstance(hash_value, dict) else {algorithm: hash_value}
+    prefix, name = escape_name(os.path.basename(file_path))
+    paths = []
+    for alg, value in digests.items():
+        sidecar = f"{file_path}.{alg}"
+        with open(sidecar, 'w') as f:
+            f.write(f"{prefix}{value} *{name}")
+        paths.append(sidecar)
+    return paths
+
+
+class ManifestWriter:
+    """Write one GNU style manifest per algorithm for a batch of files
+
+    Names are written relative to base_dir, with '/' separators.
+    """
+
+    def __init__(self, base_dir, algorithms, file_names=None):
+        self.base_dir = os.path.abspath(base_dir)
+        self.paths = {}
+        self.files = {}
+        try:
+            for algorithm in algorithms:
+                name = (file_names or {}).get(algorithm, manifest_name(algorithm))
+                path = os.path.join(self.base_dir, name)
+                self.paths[algorithm] = path
+                self.files[algorithm] = open(path, 'w', encoding='utf-8', newline='\n',
+                                             errors='surrogateescape')
+        except Exception:
+            self.close()
+            raise
+
+    def skip_own(self, paths):
+        """Filter the manifests being written out of a stream of paths"""
+        own = {os.path.normcase(path) for path in self.paths.values()}
+        for path in paths:
+            if os.path.normcase(os.path.abspath(path)) not in own:
+                yield path
+
+    def add(self, file_path, hash_value):
+        """Add a file's digest (or dict of digests)"""
+        self.add_name(os.path.relpath(os.path.abspath(file_path), self.base_dir).replace(os.sep, '/'),
+                      hash_value)
+
+    def add_name(self, name, hash_value):
+        """Add a digest under a name that is already relative, such as an archive member"""
+        prefix, name = escape_name(name)
+        digests = hash_value if isinstance(hash_value, dict) else {next(iter(self.files)): hash_value}
+        for algorithm, digest in digests.items():
+            if algorithm in self.files:
+                self.files[algorithm].write(f"{prefix}{digest} *{name}\n")
+
+    def close(self):
+        """Close every manifest file"""
+        for f in self.files.values():
+            f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
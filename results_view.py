@@ -0,0 +1,338 @@
+"""Virtual table of results for the main window
+
+A ttk.Treeview becomes slow and memory hungry with tens of thousands of
+items, so ResultsView keeps every row in a plain list and only gives the
+Treeview as many items as fit on screen. Scrolling, sorting and filtering
+change which rows those items show instead of rebuilding the widget, and
+rows streamed in by a worker are appended without touching the ones
+already shown.
+"""
+import bisect
+import tkinter as tk
+from tkinter import ttk, font as tkfont
+
+# Row fields, in order: a row is a tuple of one string per column
+COLUMNS = ("status", "algorithm", "name", "value", "path", "date")
+HEADINGS = {
+    'status': "Status",
+    'algorithm': "Algorithm",
+    'name': "File",
+    'value': "Hash / Detail",
+    'path': "Path",
+    'date': "Date"
+}
+WIDTHS = {'status': 80, 'algorithm': 80, 'name': 160, 'value': 220, 'path': 240, 'date': 130}
+
+# Filter choice that matches every row
+ALL = "All"
+
+# Colour tag of each status; other statuses are shown plain
+STATUS_TAGS = {
+    "Valid": "valid",
+    "OK": "valid",
+    "unchanged": "valid",
+    "Invalid": "invalid",
+    "FAILED": "invalid",
+    "MISSING": "invalid",
+    "Error": "invalid",
+    "modified": "invalid",
+    "removed": "invalid"
+}
+
+# Rows moved by one mouse wheel step
+WHEEL_ROWS = 3
+
+
+def merge_sorted(shown, keys, new, new_keys):
+    """Merge sorted row indexes into sorted ones; keys are their sort keys
+
+    Each new index is placed with a binary search over keys, after any
+    equal ones, and the runs in between are copied as slices. Returns the
+    merged (indexes, keys).
+    """
+    merged = []
+    merged_keys = []
+    previous = 0
+    for index, key in zip(new, new_keys):
+        position = bisect.bisect_right(keys, key, previous)
+        merged.extend(shown[previous:position])
+        merged_keys.extend(keys[previous:position])
+        merged.append(index)
+        merged_keys.append(key)
+        previous = position
+    merged.extend(shown[previous:])
+    merged_keys.extend(keys[previous:])
+    return merged, merged_keys
+
+
+class ResultsView:
+    """Sortable, filterable table that only materializes the visible rows"""
+
+    def __init__(self, parent):
+        self.frame = ttk.Frame(parent)
+        self.rows = []
+        self.shown = []  # Indexes into rows that pass the filters, in sort order
+        self.shown_keys = []  # Sort keys of the shown rows while a sort is active
+        self.sort_column = None
+        self.sort_reverse = False
+        self.top = 0  # Position in shown of the first visible row
+        self.page = 1  # Rows that fit in the Treeview
+        self.items = []  # Treeview items reused for the visible rows
+        self.selected = None  # Index into rows of the selected row
+        self.render_pending = False
+        self.statuses = set()
+        self.algorithms = set()
+
+        # Filters
+        toolbar = ttk.Frame(self.frame)
+        toolbar.pack(fill=tk.X)
+        self.status_filter = tk.StringVar(value=ALL)
+        self.algorithm_filter = tk.StringVar(value=ALL)
+        ttk.Label(toolbar, text="Status:").pack(side=tk.LEFT)
+        self.status_box = ttk.Combobox(toolbar, textvariable=self.status_filter, values=[ALL],
+                                       state="readonly", width=12)
+        self.status_box.pack(side=tk.LEFT, padx=5)
+        ttk.Label(toolbar, text="Algorithm:").pack(side=tk.LEFT)
+        self.algorithm_box = ttk.Combobox(toolbar, textvariable=self.algorithm_filter, values=[ALL],
+                                          state="readonly", width=12)
+        self.algorithm_box.pack(side=tk.LEFT, padx=5)
+        for box in (self.status_box, self.algorithm_box):
+            box.bind("<<ComboboxSelected>>", lambda event: self.apply_filters())
+        self.count_var = tk.StringVar()
+        ttk.Label(toolbar, textvariable=self.count_var).pack(side=tk.RIGHT)
+
+        # Fixed row height, so the number of rows on screen is known
+        self.style = ttk.Style()
+        self.row_height = tkfont.nametofont("TkDefaultFont").metrics("linespace") + 6
+        self.style.configure("Results.Treeview", rowheight=self.row_height)
+
+        body = ttk.Frame(self.frame)
+        body.pack(fill=tk.BOTH, expand=True, pady=5)
+        self.scrollbar = ttk.Scrollbar(body, orient=tk.VERTICAL, command=self.yview)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.tree = ttk.Treeview(body, columns=COLUMNS, show="headings", selectmode="browse",
+                                 style="Results.Treeview", height=10)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        for column in COLUMNS:
+            self.tree.heading(column, text=HEADINGS[column], command=lambda c=column: self.sort_by(c))
+            self.tree.column(column, width=WIDTHS[column], stretch=column in ("name", "value", "path"))
+        self.tree.tag_configure("valid", foreground="green")
+        self.tree.tag_configure("invalid", foreground="red")
+
+        self.tree.bind("<Configure>", self.on_resize)
+        self.tree.bind("<<TreeviewSelect>>", self.on_select)
+        self.tree.bind("<MouseWheel>", self.on_wheel)
+        self.tree.bind("<Button-4>", lambda event: self.scroll_to(self.top - WHEEL_ROWS))
+        self.tree.bind("<Button-5>", lambda event: self.scroll_to(self.top + WHEEL_ROWS))
+        for key, step in [("<Up>", -1), ("<Down>", 1), ("<Prior>", "page-up"), ("<Next>", "page-down"),
+                          ("<Home>", "home"), ("<End>", "end")]:
+            self.tree.bind(key, lambda event, s=step: self.move_selection(s))
+        self.render()
+
+    def pack(self, **options):
+        """Pack the view's frame"""
+        self.frame.pack(**options)
+
+    def set_colors(self, background, foreground):
+        """Follow the window's light/dark theme"""
+        self.style.configure("Results.Treeview", background=background,
+                             fieldbackground=background, foreground=foreground)
+
+    def clear(self):
+        """Remove every row"""
+        self.set_rows([])
+
+    def set_rows(self, rows):
+        """Replace the rows, keeping the sort order and filters"""
+        self.rows = []
+        self.statuses = set()
+        self.algorithms = set()
+        self.selected = None
+        self.top = 0
+        self.shown = []
+        self.shown_keys = []
+        self.append_rows(rows)
+
+    def append_rows(self, rows):
+        """Add rows at the end, e.g. a batch of streamed results
+
+        Only the new rows are filtered; when a sort is active only they are
+        sorted, then merged into the rows already shown using the sort keys
+        kept for those.
+        """
+        start = len(self.rows)
+        self.rows.extend(tuple(row) for row in rows)
+        new = [i for i in range(start, len(self.rows)) if self.matches(self.rows[i])]
+        self.update_choices(self.rows[start:])
+        if not new or self.sort_column is None:
+            self.shown.extend(new)
+        else:
+            key = self.sort_key()
+            new.sort(key=key)
+            self.shown, self.shown_keys = merge_sorted(self.shown, self.shown_keys,
+                                                       new, [key(i) for i in new])
+        self.schedule_render()
+
+    def update_choices(self, rows):
+        """Offer the statuses and algorithms of new rows as filters"""
+        statuses = {row[0] for row in rows} - self.statuses
+        algorithms = {row[1] for row in rows} - self.algorithms
+        if statuses:
+            self.statuses |= statuses
+            self.status_box['values'] = [ALL] + sorted(self.statuses)
+        if algorithms:
+            self.algorithms |= algorithms
+            self.algorithm_box['values'] = [ALL] + sorted(self.algorithms)
+
+    def matches(self, row):
+        """Return True if a row passes the status and algorithm filters"""
+        status = self.status_filter.get()
+        algorithm = self.algorithm_filter.get()
+        return (status == ALL or row[0] == status) and (algorithm == ALL or row[1] == algorithm)
+
+    def apply_filters(self):
+        """Recompute the shown rows after a filter changed"""
+        self.shown = [i for i, row in enumerate(self.rows) if self.matches(row)]
+        if self.sort_column is not None:
+            self.sort_shown()
+        self.top = 0
+        self.render()
+
+    def sort_key(self):
+        """Return the key that sorts row indexes by the sort column"""
+        column = COLUMNS.index(self.sort_column)
+        rows = self.rows
+        return lambda i: rows[i][column].lower()
+
+    def sort_shown(self):
+        """Sort the shown rows by the sort column, keeping their keys for appends"""
+        key = self.sort_key()
+        self.shown.sort(key=key)
+        self.shown_keys = [key(i) for i in self.shown]
+
+    def sort_by(self, column):
+        """Sort by a column; clicking the same heading again reverses the order"""
+        if column == self.sort_column:
+            # shown stays ascending; row_at reads it backwards
+            self.sort_reverse = not self.sort_reverse
+        else:
+            self.sort_column = column
+            self.sort_reverse = False
+            self.sort_shown()
+        for name in COLUMNS:
+            arrow = (" ▼" if self.sort_reverse else " ▲") if name == column else ""
+            self.tree.heading(name, text=HEADINGS[name] + arrow)
+        self.render()
+
+    def row_at(self, position):
+        """Return the index into rows of a position in the shown order"""
+        if self.sort_reverse:
+            return self.shown[len(self.shown) - 1 - position]
+        return self.shown[position]
+
+    def schedule_render(self):
+        """Render once the Tk thread is idle, however many batches arrive"""
+        if not self.render_pending:
+            self.render_pending = True
+            self.frame.after_idle(self.render)
+
+    def render(self):
+        """Show the rows from self.top in the reused Treeview items"""
+        self.render_pending = False
+        count = len(self.shown)
+        self.top = max(0, min(self.top, count - self.page))
+        needed = min(self.page, count - self.top)
+        while len(self.items) < needed:
+            self.items.append(self.tree.insert("", tk.END))
+        while len(self.items) > needed:
+            self.tree.delete(self.items.pop())
+
+        selected_item = None
+        for offset, item in enumerate(self.items):
+            index = self.row_at(self.top + offset)
+            row = self.rows[index]
+            self.tree.item(item, values=row, tags=(STATUS_TAGS.get(row[0], ""),))
+            if index == self.selected:
+                selected_item = item
+        if selected_item is not None:
+            self.tree.selection_set(selected_item)
+        elif self.tree.selection():
+            self.tree.selection_remove(self.tree.selection())
+
+        if count:
+            self.scrollbar.set(self.top / count, (self.top + needed) / count)
+        else:
+            self.scrollbar.set(0, 1)
+        if count == len(self.rows):
+            self.count_var.set(f"{count} rows")
+        else:
+            self.count_var.set(f"{count} of {len(self.rows)} rows")
+
+    def scroll_to(self, top):
+        """Make the row at position top the first visible one"""
+        top = max(0, min(int(top), len(self.shown) - self.page))
+        if top != self.top:
+            self.top = top
+            self.render()
+        return "break"
+
+    def yview(self, *args):
+        """Scrollbar command"""
+        if args[0] == "moveto":
+            self.scroll_to(float(args[1]) * len(self.shown))
+        elif args[0] == "scroll":
+            step = self.page if args[2] == "pages" else 1
+            self.scroll_to(self.top + int(args[1]) * step)
+
+    def on_wheel(self, event):
+        """Scroll on Windows and macOS mouse wheel events"""
+        return self.scroll_to(self.top + (-WHEEL_ROWS if event.delta > 0 else WHEEL_ROWS))
+
+    def on_resize(self, event):
+        """Recompute how many rows fit when the window is resized"""
+        # One row height is taken by the headings
+        page = max(1, event.height // self.row_height - 1)
+        if page != self.page:
+            self.page = page
+            self.render()
+
+    def on_select(self, event):
+        """Remember the selected row so it stays selected while scrolling"""
+        selection = self.tree.selection()
+        if selection and selection[0] in self.items:
+            self.selected = self.row_at(self.top + self.items.index(selection[0]))
+
+    def selected_row(self):
+        """Return the selected row tuple, or None"""
+        return None if self.selected is None else self.rows[self.selected]
+
+    def move_selection(self, step):
+        """Move the selection with the keyboard, scrolling past the visible rows"""
+        count = len(self.shown)
+        if not count:
+            return "break"
+        position = None
+        if self.selected is not None:
+            for offset in range(len(self.items)):
+                if self.row_at(self.top + offset) == self.selected:
+                    position = self.top + offset
+        if position is None:
+            position = self.top - 1 if step in (1, "page-down") else self.top + len(self.items)
+        if step == "page-up":
+            position -= self.page
+        elif step == "page-down":
+            position += self.page
+        elif step == "home":
+            position = 0
+        elif step == "end":
+            position = count - 1
+        else:
+            position += step
+        position = max(0, min(position, count - 1))
+        self.selected = self.row_at(position)
+        if position < self.top:
+            self.top = position
+        elif position >= self.top + self.page:
+            self.top = position - self.page + 1
+        self.render()
+        return "break"
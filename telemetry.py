@@ -0,0 +1,156 @@
+"""Performance telemetry of hashing runs
+
+A Telemetry object records one JSON line per hashed file (bytes, wall
+time, time spent opening, stat'ing and reading the file, the rest being
+digest time, and how long the file's task waited in the executor queue),
+plus the time the Tk thread spends applying results. Totals are kept for a
+one-line summary.
+
+With profile=True the run is also captured with cProfile and tracemalloc
+and the reports are written next to the JSON lines.
+"""
+import cProfile
+import io
+import json
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+
+# Totals kept by Telemetry, in seconds except for files and bytes
+TOTAL_FIELDS = ("files", "bytes", "wall", "open", "stat", "read", "digest", "queue_wait", "ui")
+
+
+def new_timings():
+    """Return the dict hash_core fills when given timings="""
+    return {'bytes': 0, 'open': 0.0, 'stat': 0.0, 'read': 0.0}
+
+
+class Telemetry:
+    """Collects per-file timings of a run and writes them as JSON lines"""
+
+    def __init__(self, log_dir, profile=False):
+        stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        self.log_path = os.path.join(log_dir, f"telemetry_{stamp}.jsonl")
+        self.profile_path = os.path.join(log_dir, f"profile_{stamp}") if profile else None
+        self.lock = threading.Lock()
+        self.file = open(self.log_path, 'w', encoding='utf-8')
+        self.totals = dict.fromkeys(TOTAL_FIELDS, 0)
+        self.local = threading.local()
+        self.profilers = []
+        if profile:
+            tracemalloc.start()
+
+    def write(self, record):
+        """Add a timestamp and write a record as one JSON line"""
+        record['time'] = round(time.time(), 3)
+        line = json.dumps(record) + "\n"
+        with self.lock:
+            if not self.file.closed:
+                self.file.write(line)
+
+    def digest(self, file_path, func, *args, queue_wait=0.0, **kwargs):
+        """Call func(*args, timings=..., **kwargs) and record how the time went
+
+        func is compute_digest or cached_digest. Time not spent opening,
+        stat'ing or reading the file counts as digest time.
+        """
+        timings = new_timings()
+        start = time.perf_counter()
+        error = None
+        try:
+            return self.profiled(func, *args, timings=timings, **kwargs)
+        except Exception as e:
+            error = str(e)
+            raise
+        finally:
+            wall = time.perf_counter() - start
+            # The first read includes opening the file
+            read = max(0.0, timings['read'] - timings['open'])
+            digest = max(0.0, wall - read - timings['open'] - timings['stat'])
+            record = {'event': "file", 'path': file_path, 'bytes': timings['bytes'],
+                      'wall': round(wall, 6), 'open': round(timings['open'], 6),
+                      'stat': round(timings['stat'], 6), 'read': round(read, 6),
+                      'digest': round(digest, 6), 'queue_wait': round(queue_wait, 6),
+                      'thread': threading.current_thread().name}
+            if error is not None:
+                record['error'] = error
+            with self.lock:
+                self.totals['files'] += 1
+                for field in ("bytes", "wall", "open", "stat", "read", "digest", "queue_wait"):
+                    self.totals[field] += record[field]
+            self.write(record)
+
+    def task(self, files, size, wall, queue_wait):
+        """Record a group of files hashed in a worker process"""
+        with self.lock:
+            self.totals['files'] += files
+            self.totals['bytes'] += size
+            self.totals['wall'] += wall
+            self.totals['queue_wait'] += queue_wait
+        self.write({'event': "task", 'files': files, 'bytes': size,
+                    'wall': round(wall, 6), 'queue_wait': round(queue_wait, 6)})
+
+    def ui(self, name, seconds):
+        """Record time the Tk thread spent applying results"""
+        with self.lock:
+            self.totals['ui'] += seconds
+        self.write({'event': "ui", 'name': name, 'wall': round(seconds, 6)})
+
+    def profiled(self, func, *args, **kwargs):
+        """Call func, under this thread's profiler when profiling"""
+        if self.profile_path is None:
+            return func(*args, **kwargs)
+        profiler = getattr(self.local, 'profiler', None)
+        if profiler is None:
+            profiler = self.local.profiler = cProfile.Profile()
+            with self.lock:
+                self.profilers.append(profiler)
+        if getattr(self.local, 'active', False):
+            return func(*args, **kwargs)
+        self.local.active = True
+        try:
+            return profiler.runcall(func, *args, **kwargs)
+        except ValueError as e:
+            # Python 3.12+ profiles every thread from the first profiler
+            if "profiling tool" not in str(e):
+                raise
+            return func(*args, **kwargs)
+        finally:
+            self.local.active = False
+
+    def summary(self):
+        """Describe where the time went, for the status bar"""
+        t = self.totals
+        busy = t['open'] + t['stat'] + t['read'] + t['digest']
+        if not busy:
+            return f"{t['files']} files, queue wait {t['queue_wait']:.1f}s, UI {t['ui']:.1f}s"
+        return (f"read {100 * t['read'] / busy:.0f}% / digest {100 * t['digest'] / busy:.0f}% / "
+                f"open+stat {100 * (t['open'] + t['stat']) / busy:.0f}%, "
+                f"queue wait {t['queue_wait']:.1f}s, UI {t['ui']:.1f}s")
+
+    def close(self):
+        """Write the totals and, when profiling, the profile reports"""
+        self.write({'event': "summary", **{k: round(v, 6) for k, v in self.totals.items()}})
+        with self.lock:
+            self.file.close()
+        if self.profile_path is None:
+            return
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        profilers = [p for p in self.profilers if p.getstats()]
+        report = io.StringIO()
+        if profilers:
+            stats = pstats.Stats(profilers[0], stream=report)
+            for profiler in profilers[1:]:
+                stats.add(profiler)
+            stats.dump_stats(self.profile_path + ".prof")
+            stats.sort_stats("cumulative").print_stats(40)
+        report.write(f"\ntracemalloc: current {current} bytes, peak {peak} bytes\n")
+        for stat in snapshot.statistics("lineno")[:20]:
+            report.write(f"{stat}\n")
+        with open(self.profile_path + ".txt", 'w', encoding='utf-8') as f:
+            f.write(report.getvalue())
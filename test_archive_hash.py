@@ -0,0 +1,73 @@
+"""Tests for hashing archive members"""
+import hashlib
+import io
+import tarfile
+import zipfile
+
+import pytest
+
+import archive_hash
+from archive_hash import hash_archive
+
+
+def write_zip(path, members):
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, data in members:
+            archive.writestr(name, data)
+
+
+def corrupt_member(path, name):
+    """Overwrite the start of a member's compressed data"""
+    with zipfile.ZipFile(path) as archive:
+        info = archive.getinfo(name)
+    with open(path, "r+b") as f:
+        f.seek(info.header_offset + 26)
+        name_length = int.from_bytes(f.read(2), "little")
+        extra_length = int.from_bytes(f.read(2), "little")
+        f.seek(name_length + extra_length, 1)
+        # Block type 3 is reserved: "invalid block type"
+        f.write(b"\xff" * 8)
+
+
+def test_corrupt_deflate_member_is_reported(tmp_path):
+    path = tmp_path / "data.zip"
+    good = b"good data " * 1000
+    write_zip(path, [("bad.txt", bytes(range(256)) * 200), ("good.txt", good)])
+    corrupt_member(path, "bad.txt")
+
+    results = {name: (hash_value, error) for name, size, hash_value, error
+               in hash_archive(str(path), "sha256", workers=2)}
+
+    assert results["bad.txt"][0] is None
+    assert results["bad.txt"][1] is not None
+    assert results["good.txt"] == (hashlib.sha256(good).hexdigest(), None)
+
+
+def test_tar_truncated_after_good_member_raises(tmp_path, monkeypatch):
+    data = io.BytesIO()
+    with tarfile.open(fileobj=data, mode="w:gz") as tar:
+        for name in "abc":
+            member = (name * 1000).encode()
+            info = tarfile.TarInfo(name + ".txt")
+            info.size = len(member)
+            tar.addfile(info, io.BytesIO(member))
+    path = tmp_path / "data.tgz"
+    path.write_bytes(data.getvalue()[:-30])
+
+    # Only the first member fails; the stream itself breaks later on
+    hash_stream = archive_hash.hash_stream
+    calls = []
+
+    def failing_first(f, *args, **kwargs):
+        calls.append(f)
+        if len(calls) == 1:
+            raise OSError("bad member")
+        return hash_stream(f, *args, **kwargs)
+
+    monkeypatch.setattr(archive_hash, "hash_stream", failing_first)
+    results = []
+    with pytest.raises(tarfile.ReadError):
+        for result in hash_archive(str(path), "sha256"):
+            results.append(result)
+    assert [name for name, size, hash_value, error in results] == ["a.txt", "b.txt"]
+    assert results[1][3] is None
@@ -0,0 +1,52 @@
+"""Tests for reading and checking checksum manifests"""
+import hashlib
+import os
+
+from hash_engine import HashEngine
+from manifest import ManifestWriter, parse_line, verify_manifest, OK
+
+
+def test_bsd_tag_of_sha3_is_a_registry_name():
+    entry = parse_line("SHA3-256 (a.txt) = " + "0" * 64)
+    assert entry.algorithm == "sha3_256"
+    assert entry.name == "a.txt"
+
+
+def test_sha3_256sum_tag_manifest_round_trip(tmp_path):
+    data = b"manifest data\n"
+    (tmp_path / "a.txt").write_bytes(data)
+    # As written by "sha3-256sum --tag a.txt" or "openssl dgst -sha3-256"
+    manifest = tmp_path / "CHECKSUMS"
+    manifest.write_text(f"SHA3-256 (a.txt) = {hashlib.sha3_256(data).hexdigest()}\n"
+                        f"BLAKE2b (a.txt) = {hashlib.blake2b(data).hexdigest()}\n")
+
+    results = list(verify_manifest(str(manifest), engine=HashEngine(workers=1)))
+
+    assert [(entry.algorithm, status) for entry, status, actual, error in results] == \
+        [("sha3_256", OK), ("blake2b", OK)]
+
+
+def test_gnu_manifest_named_after_sha3(tmp_path):
+    data = b"manifest data\n"
+    (tmp_path / "a.txt").write_bytes(data)
+    manifest = tmp_path / "SHA3-256SUMS"
+    manifest.write_text(f"{hashlib.sha3_256(data).hexdigest()}  a.txt\n")
+
+    results = list(verify_manifest(str(manifest), engine=HashEngine(workers=1)))
+
+    assert [status for entry, status, actual, error in results] == [OK]
+
+
+def test_tree_manifest_round_trip(tmp_path):
+    (tmp_path / "a.bin").write_bytes(b"tree data" * 1000)
+    engine = HashEngine(workers=1)
+    with ManifestWriter(str(tmp_path), ["tree-sha256"]) as writer:
+        for index, path, hash_value, error in engine.hash_ordered([str(tmp_path / "a.bin")], "tree-sha256"):
+            writer.add(path, hash_value)
+    manifest = writer.paths["tree-sha256"]
+    assert os.path.basename(manifest) == "TREE-SHA256SUMS"
+
+    results = list(verify_manifest(manifest, engine=engine))
+
+    assert [(entry.algorithm, status) for entry, status, actual, error in results] == [("tree-sha256", OK)]
+    assert parse_line("TREE-SHA256 (a.bin) = " + results[0][2]).algorithm == "tree-sha256"
@@ -0,0 +1,237 @@
+"""Tree digests: a file hashed as fixed-size chunks in parallel
+
+The chunks of one file are hashed on several threads and their digests are
+combined pairwise into a single root digest (a Merkle tree), so a single
+huge file is hashed on every core. The chunk digests are kept: comparing
+two trees of the same file tells which byte ranges differ, and only those
+ranges need to be read again to re-check them.
+
+Tree algorithms are named "tree-" plus a registered algorithm name, e.g. "tree-sha256".
+
+As in RFC 6962, chunk (leaf) hashes are prefixed with 0x00 and node hashes
+with 0x01, so a node can never pass for the contents of a chunk. The root
+also covers the file size and the chunk size, and is therefore never the
+plain hash of the file, even for a file of one chunk.
+"""
+import json
+import os
+import struct
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from algorithms import new_hash
+from hash_core import HashCancelled, MAX_CHUNK_SIZE, advise_sequential
+
+TREE_PREFIX = "tree-"
+# Version of the tree construction, stored in saved trees
+TREE_FORMAT = 2
+# Domain separation of leaf, node and root hashes
+LEAF_PREFIX = b"\x00"
+NODE_PREFIX = b"\x01"
+ROOT_PREFIX = b"\x02"
+# Bytes covered by each leaf of the tree; part of what the root digest means
+TREE_CHUNK_SIZE = 64 * 1024 * 1024
+# Chunks queued per worker thread
+MAX_IN_FLIGHT = 2
+
+
+def is_tree_algorithm(algorithm):
+    """Return True for tree algorithm names such as tree-sha256"""
+    return isinstance(algorithm, str) and algorithm.startswith(TREE_PREFIX)
+
+
+def base_algorithm(algorithm):
+    """Return the algorithm a tree algorithm hashes chunks with"""
+    return algorithm[len(TREE_PREFIX):] if is_tree_algorithm(algorithm) else algorithm
+
+
+def combine(algorithm, left, right):
+    """Hash two binary digests into their parent node"""
+    hash_obj = new_hash(algorithm)
+    hash_obj.update(NODE_PREFIX + left + right)
+    return hash_obj.digest()
+
+
+def merkle_root(algorithm, chunk_digests, size, chunk_size):
+    """Combine hex chunk digests pairwise into the hex root digest
+
+    Each level hashes the concatenated binary digests of two neighbours;
+    an odd digest at the end of a level moves up unchanged. The top of the
+    tree is hashed once more with the file size and the chunk size.
+    """
+    level = [bytes.fromhex(digest) for digest in chunk_digests]
+    while len(level) > 1:
+        level = [combine(algorithm, level[i], level[i + 1]) if i + 1 < len(level) else level[i]
+                 for i in range(0, len(level), 2)]
+    hash_obj = new_hash(algorithm)
+    hash_obj.update(ROOT_PREFIX + struct.pack(">QQ", size, chunk_size) + level[0])
+    return hash_obj.hexdigest()
+
+
+def hash_range(file_path, algorithm, offset, length, progress=None, cancel_event=None, timings=None):
+    """Hash `length` bytes of a file starting at offset, as a leaf of the tree
+
+    With a timings dict the open and read times and the bytes read are
+    added to it, as hash_core.read_chunks does.
+    """
+    clock = time.perf_counter
+    hash_obj = new_hash(algorithm)
+    hash_obj.update(LEAF_PREFIX)
+    buffer = bytearray(min(MAX_CHUNK_SIZE, length) or 1)
+    view = memoryview(buffer)
+    start = clock()
+    with open(file_path, 'rb', buffering=0) as f:
+        if timings is not None:
+            # Counted as read time as well, like the first read of read_chunks
+            timings['open'] += clock() - start
+            timings['read'] += clock() - start
+        advise_sequential(f)
+        f.seek(offset)
+        remaining = length
+        while remaining > 0:
+            if cancel_event is not None and cancel_event.is_set():
+                raise HashCancelled()
+            start = clock()
+            count = f.readinto(view[:min(len(buffer), remaining)])
+            if timings is not None:
+                timings['read'] += clock() - start
+                timings['bytes'] += count
+            if not count:
+                break
+            hash_obj.update(view[:count])
+            remaining -= count
+            if progress is not None:
+                progress(count)
+    return hash_obj.hexdigest()
+
+
+class TreeDigest:
+    """Root and chunk digests of a file hashed with tree_hash"""
+
+    def __init__(self, algorithm, size, chunk_size, chunks):
+        self.algorithm = algorithm
+        self.size = size
+        self.chunk_size = chunk_size
+        self.chunks = chunks
+        self.root = merkle_root(base_algorithm(algorithm), chunks, size, chunk_size)
+
+    def chunk_range(self, index):
+        """Return the (offset, length) covered by a chunk"""
+        offset = index * self.chunk_size
+        return offset, max(0, min(self.chunk_size, self.size - offset))
+
+    def diff(self, other):
+        """Return the indexes of the chunks that differ from another tree
+
+        Chunks past the end of the shorter file count as different.
+        """
+        if other.algorithm != self.algorithm or other.chunk_size != self.chunk_size:
+            raise ValueError("Tree digests use different algorithms or chunk sizes")
+        count = max(len(self.chunks), len(other.chunks))
+        return [i for i in range(count)
+                if i >= len(self.chunks) or i >= len(other.chunks) or self.chunks[i] != other.chunks[i]]
+
+    def to_dict(self):
+        """Return the tree as a JSON-friendly dict"""
+        return {'format': TREE_FORMAT, 'algorithm': self.algorithm, 'size': self.size,
+                'chunk_size': self.chunk_size, 'root': self.root, 'chunks': self.chunks}
+
+    @classmethod
+    def from_dict(cls, data):
+        """Rebuild a tree saved with to_dict"""
+        if data.get('format') != TREE_FORMAT:
+            raise ValueError("Tree saved by an older version; hash the file again to save a new one")
+        tree = cls(data['algorithm'], data['size'], data['chunk_size'], list(data['chunks']))
+        if tree.root != data.get('root', tree.root):
+            raise ValueError("Chunk digests do not match the root digest")
+        return tree
+
+
+def save_tree(tree, file_path):
+    """Write a tree digest to a JSON file"""
+    with open(file_path, 'w', encoding='utf-8') as f:
+        json.dump(tree.to_dict(), f, indent=1)
+
+
+def load_tree(file_path):
+    """Read a tree digest written by save_tree"""
+    with open(file_path, 'r', encoding='utf-8') as f:
+        return TreeDigest.from_dict(json.load(f))
+
+
+def hash_chunks(file_path, algorithm, ranges, workers=None, progress=None, cancel_event=None,
+                timings=None):
+    """Hash (offset, length) ranges of a file on a thread pool
+
+    Returns the hex digests in the order of ranges. At most MAX_IN_FLIGHT
+    ranges per worker are queued at a time. With a timings dict the times
+    of all ranges are added up in it.
+    """
+    workers = max(1, int(workers or os.cpu_count() or 1))
+    digests = [None] * len(ranges)
+    if workers == 1:
+        # No pool: e.g. inside a HashEngine worker, whose siblings use the other cores
+        return [hash_range(file_path, algorithm, offset, length, progress, cancel_event, timings)
+                for offset, length in ranges]
+    # One dict per range, so the worker threads never update the same one
+    range_timings = [dict.fromkeys(timings, 0) for _ in ranges] if timings is not None else None
+    executor = ThreadPoolExecutor(max_workers=workers)
+    in_flight = {}
+    try:
+        for i, (offset, length) in enumerate(ranges):
+            if cancel_event is not None and cancel_event.is_set():
+                raise HashCancelled()
+            future = executor.submit(hash_range, file_path, algorithm, offset, length,
+                                     progress, cancel_event,
+                                     range_timings[i] if range_timings is not None else None)
+            in_flight[future] = i
+            if len(in_flight) >= workers * MAX_IN_FLIGHT:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    digests[in_flight.pop(future)] = future.result()
+        for future in list(in_flight):
+            digests[in_flight.pop(future)] = future.result()
+    except BaseException:
+        for future in in_flight:
+            future.cancel()
+        executor.shutdown(wait=False)
+        raise
+    executor.shutdown()
+    if timings is not None:
+        for part in range_timings:
+            for key, value in part.items():
+                timings[key] += value
+    return digests
+
+
+def tree_hash(file_path, algorithm="tree-sha256", chunk_size=TREE_CHUNK_SIZE, workers=None,
+              progress=None, cancel_event=None, timings=None):
+    """Hash a file as chunk_size chunks in parallel and return a TreeDigest"""
+    if not is_tree_algorithm(algorithm):
+        algorithm = TREE_PREFIX + algorithm
+    size = os.path.getsize(file_path)
+    ranges = [(offset, min(chunk_size, size - offset)) for offset in range(0, size, chunk_size)] or [(0, 0)]
+    chunks = hash_chunks(file_path, base_algorithm(algorithm), ranges, workers, progress, cancel_event,
+                         timings)
+    return TreeDigest(algorithm, size, chunk_size, chunks)
+
+
+def check_chunks(file_path, tree, indexes=None, workers=None, progress=None, cancel_event=None):
+    """Re-read chunks of a file and return the indexes that no longer match
+
+    Only the chunks listed in indexes are read (all of them by default),
+    e.g. the ones TreeDigest.diff reported after a repair. A file whose
+    size changed fails every chunk past the shorter end.
+    """
+    size = os.path.getsize(file_path)
+    indexes = list(range(len(tree.chunks)) if indexes is None else indexes)
+    bad = set(i for i in indexes if i >= len(tree.chunks))
+    if size != tree.size:
+        # Chunks from the one holding the shorter end onwards cannot match
+        first_bad = min(size, tree.size) // tree.chunk_size
+        bad.update(i for i in indexes if i >= first_bad)
+    to_read = [i for i in indexes if i not in bad]
+    digests = hash_chunks(file_path, base_algorithm(tree.algorithm), [tree.chunk_range(i) for i in to_read],
+                          workers, progress, cancel_event)
+    bad.update(i for i, digest in zip(to_read, digests) if digest != tree.chunks[i])
+    return sorted(bad)
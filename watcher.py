@@ -0,0 +1,375 @@
+"""Continuous integrity monitoring of a folder
+
+FolderWatcher keeps a live digest index of a folder, in the baseline
+format of baseline.py, instead of rerunning a full batch on a schedule.
+Changes are reported by inotify on Linux; elsewhere, or when inotify is
+out of watches, the folder is polled and files whose size or modification
+time changed are picked up. Bursts of events for a file are debounced:
+it is hashed once it has been quiet for `debounce` seconds, or after
+MAX_DELAY seconds for files that never stop changing. The files that
+settled are then hashed together on a HashEngine pool and the index is
+updated and saved.
+"""
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import sqlite3
+import struct
+import threading
+import time
+from datetime import datetime
+
+from baseline import new_baseline, load_baseline, save_baseline, update_entries, relative_name, REMOVED
+from file_scanner import scan_tree, matches
+from hash_core import HashCancelled
+from hash_engine import HashEngine
+
+# Seconds a file must be quiet before it is hashed
+DEBOUNCE = 2.0
+# Files still changing after this many seconds are hashed anyway
+MAX_DELAY = 30.0
+# Seconds between two scans when polling
+POLL_INTERVAL = 60.0
+# Seconds between two saves of the index
+SAVE_INTERVAL = 30.0
+
+# inotify(7) constants
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_ISDIR = 0x40000000
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE
+              | IN_DELETE | IN_DELETE_SELF | IN_ONLYDIR | IN_DONT_FOLLOW)
+EVENT_HEADER = struct.Struct("iIII")
+
+
+class InotifySource:
+    """Recursive inotify watch of a folder
+
+    read() returns the paths of files that had events, the folders that
+    appeared (their files must be scanned) and the folders that went away.
+    Raises OSError when inotify is not available or out of watches.
+    """
+
+    def __init__(self, root, wanted_dir):
+        try:
+            self.libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            init = self.libc.inotify_init1
+        except (OSError, AttributeError):
+            raise OSError(errno.ENOSYS, "inotify is not available")
+        self.fd = init(os.O_CLOEXEC | os.O_NONBLOCK)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.wanted_dir = wanted_dir
+        self.dirs = {}  # Watch descriptor -> folder path
+        try:
+            self.add_tree(root)
+        except OSError:
+            self.close()
+            raise
+
+    def add_tree(self, root):
+        """Watch a folder and the folders below it"""
+        for path, dirnames, _ in os.walk(root):
+            self.add_watch(path)
+            dirnames[:] = [name for name in dirnames if self.wanted_dir(os.path.join(path, name))]
+
+    def add_watch(self, path):
+        """Watch one folder"""
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            error = ctypes.get_errno()
+            if error == errno.ENOSPC:
+                raise OSError(error, "inotify watch limit reached (fs.inotify.max_user_watches)")
+            # The folder went away before it could be watched
+            return
+        self.dirs[wd] = path
+
+    def read(self, timeout):
+        """Wait up to timeout seconds and return (files, new_dirs, gone_dirs, overflow)"""
+        files = set()
+        new_dirs = []
+        gone_dirs = []
+        overflow = False
+        if not select.select([self.fd], [], [], max(0.0, timeout))[0]:
+            return files, new_dirs, gone_dirs, overflow
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+                name = data[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length].rstrip(b"\0")
+                offset += EVENT_HEADER.size + length
+                if mask & IN_Q_OVERFLOW:
+                    overflow = True
+                    continue
+                if mask & IN_IGNORED:
+                    self.dirs.pop(wd, None)
+                    continue
+                folder = self.dirs.get(wd)
+                if folder is None or (mask & IN_DELETE_SELF):
+                    continue
+                path = os.path.join(folder, os.fsdecode(name))
+                if not mask & IN_ISDIR:
+                    files.add(path)
+                elif mask & (IN_CREATE | IN_MOVED_TO):
+                    if self.wanted_dir(path):
+                        self.add_tree(path)
+                        new_dirs.append(path)
+                elif mask & (IN_DELETE | IN_MOVED_FROM):
+                    gone_dirs.append(path)
+        return files, new_dirs, gone_dirs, overflow
+
+    def close(self):
+        """Stop watching"""
+        os.close(self.fd)
+
+
+class FolderWatcher:
+    """Live digest index of a folder, updated as files change
+
+    on_changes is called from the watcher's thread with a list of
+    (status, path, entry, old_entry, error) tuples after each batch of
+    settled files; status is one of baseline's ADDED, MODIFIED, REMOVED or
+    UNCHANGED (the file was rewritten with the same content). on_status is
+    called with a short description of what the watcher is doing. If
+    watching fails, e.g. the folder or the index cannot be read or written,
+    the error is kept in `error` and passed to on_error as the watcher stops.
+    """
+
+    def __init__(self, root, algorithm="sha256", engine=None, index_path=None,
+                 on_changes=None, on_status=None, on_error=None, debounce=DEBOUNCE,
+                 poll_interval=POLL_INTERVAL, use_inotify=True, **scan_options):
+        self.root = os.path.abspath(root)
+        self.index_path = index_path
+        self.baseline = None
+        if index_path is not None and os.path.exists(index_path):
+            baseline = load_baseline(index_path)
+            if baseline['root'] == self.root and baseline['algorithm'] == algorithm:
+                self.baseline = baseline
+        if self.baseline is None:
+            self.baseline = new_baseline(self.root, algorithm, scan_options)
+        self.scan_options = self.baseline.get('scan', {})
+        self.stop_event = threading.Event()
+        self.engine = engine or HashEngine()
+        # Stopping interrupts a batch that is being hashed
+        self.engine.cancel_event = self.stop_event
+        self.on_changes = on_changes
+        self.on_status = on_status
+        self.on_error = on_error
+        self.error = None
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.use_inotify = use_inotify
+        self.mode = None  # "inotify" or "polling" once running
+        self.pending = {}  # path -> (first event, last event)
+        self.last_save = time.monotonic()
+        self.dirty = False
+        self.thread = None
+
+    def status(self, message):
+        """Report what the watcher is doing"""
+        if self.on_status is not None:
+            self.on_status(message)
+
+    def fail(self, error):
+        """Report the error that stopped the watcher"""
+        if self.error is not None:
+            return
+        self.error = error
+        self.status(f"Stopped watching {self.root}: {error}")
+        if self.on_error is not None:
+            self.on_error(error)
+
+    def wanted(self, path, is_dir=False):
+        """Apply the scan options to a path reported by inotify"""
+        rel_path = os.path.relpath(path, self.root)
+        if rel_path.startswith(os.pardir):
+            return False
+        parts = rel_path.split(os.sep)
+        for depth in range(len(parts)):
+            name = parts[depth]
+            partial = os.sep.join(parts[:depth + 1])
+            if not self.scan_options.get('include_hidden') and name.startswith('.'):
+                return False
+            if self.scan_options.get('exclude') and matches(self.scan_options['exclude'], name, partial):
+                return False
+        include = self.scan_options.get('include')
+        if is_dir or not include:
+            return True
+        return matches(include, parts[-1], rel_path)
+
+    def scan(self):
+        """Queue every file whose size or time differs from the index, and every missing one"""
+        files = self.baseline['files']
+        seen = set()
+        for path in scan_tree(self.root, **self.scan_options):
+            name = relative_name(path, self.root)
+            seen.add(name)
+            old = files.get(name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            if old is None or old['size'] != st.st_size or old['mtime_ns'] != st.st_mtime_ns:
+                self.queue(path)
+            if self.stop_event.is_set():
+                return
+        for name in files:
+            if name not in seen:
+                self.queue(os.path.join(self.root, name))
+
+    def queue(self, path, now=None):
+        """Note an event for a path, restarting its quiet period"""
+        now = time.monotonic() if now is None else now
+        first = self.pending.get(path, (now, now))[0]
+        self.pending[path] = (first, now)
+
+    def settled(self, now):
+        """Remove and return the pending paths that are due"""
+        due = [path for path, (first, last) in self.pending.items()
+               if now - last >= self.debounce or now - first >= MAX_DELAY]
+        for path in due:
+            del self.pending[path]
+        return due
+
+    def process(self, paths):
+        """Hash the settled paths, update the index and report the changes"""
+        files = self.baseline['files']
+        changes = []
+        to_hash = []
+        for path in paths:
+            name = relative_name(path, self.root)
+            try:
+                st = os.stat(path)
+                is_file = os.path.isfile(path) and not os.path.islink(path)
+            except OSError:
+                st = None
+                is_file = False
+            if not is_file:
+                if name in files:
+                    changes.append((REMOVED, path, None, files.pop(name), None))
+                continue
+            old = files.get(name)
+            if old is not None and old['size'] == st.st_size and old['mtime_ns'] == st.st_mtime_ns:
+                continue
+            to_hash.append((name, st))
+        if to_hash:
+            self.status(f"Hashing {len(to_hash)} changed files in {self.root}")
+        old_entries = {name: files.get(name) for name, _ in to_hash}
+        for status, name, entry, error in update_entries(self.baseline, to_hash, self.engine):
+            changes.append((status, os.path.join(self.root, name), entry, old_entries[name], error))
+        if changes:
+            self.dirty = True
+            if self.on_changes is not None:
+                self.on_changes(changes)
+        return changes
+
+    def save(self, force=False):
+        """Write the index when it changed, at most every SAVE_INTERVAL seconds"""
+        if self.index_path is None or not self.dirty:
+            return
+        if force or time.monotonic() - self.last_save >= SAVE_INTERVAL:
+            save_baseline(self.baseline, self.index_path)
+            self.dirty = False
+            self.last_save = time.monotonic()
+
+    def open_source(self):
+        """Return an InotifySource, or None to poll"""
+        if not self.use_inotify:
+            return None
+        try:
+            return InotifySource(self.root, lambda path: self.wanted(path, is_dir=True))
+        except OSError as e:
+            self.status(f"Polling every {self.poll_interval:.0f}s ({e.strerror or e})")
+            return None
+
+    def run(self):
+        """Watch until stop() is called; blocks the calling thread"""
+        source = self.open_source()
+        self.mode = "inotify" if source is not None else "polling"
+        try:
+            # Catch up with changes made while nobody was watching
+            self.status(f"Indexing {self.root}")
+            self.scan()
+            self.process(self.settled(float('inf')))
+            self.save(force=True)
+            self.status(f"Watching {self.root} ({self.mode}, {len(self.baseline['files'])} files)")
+            next_poll = time.monotonic() + self.poll_interval
+            while not self.stop_event.is_set():
+                now = time.monotonic()
+                wait = self.debounce if self.pending else self.poll_interval
+                if source is not None:
+                    try:
+                        files, new_dirs, gone_dirs, overflow = source.read(min(wait, 1.0))
+                    except OSError as e:
+                        # Out of watches for a new folder: poll from now on
+                        source.close()
+                        source = None
+                        self.mode = "polling"
+                        self.status(f"Polling every {self.poll_interval:.0f}s ({e.strerror or e})")
+                        self.scan()
+                        next_poll = time.monotonic() + self.poll_interval
+                        continue
+                    now = time.monotonic()
+                    for path in files:
+                        if self.wanted(path):
+                            self.queue(path, now)
+                    for folder in new_dirs:
+                        for path in scan_tree(folder, **self.scan_options):
+                            self.queue(path, now)
+                    for folder in gone_dirs:
+                        prefix = relative_name(folder, self.root) + "/"
+                        for name in [name for name in self.baseline['files'] if name.startswith(prefix)]:
+                            self.queue(os.path.join(self.root, name), now)
+                    if overflow:
+                        # Events were lost: compare the whole folder again
+                        self.scan()
+                else:
+                    self.stop_event.wait(min(wait, max(0.0, next_poll - now), 1.0))
+                    now = time.monotonic()
+                    if now >= next_poll:
+                        self.scan()
+                        next_poll = now + self.poll_interval
+                due = self.settled(now)
+                if due:
+                    self.process(due)
+                    self.status(f"Watching {self.root} ({self.mode}, {len(self.baseline['files'])} files), "
+                                f"last change {datetime.now().strftime('%H:%M:%S')}")
+                self.save()
+        except HashCancelled:
+            pass
+        except (OSError, sqlite3.Error) as e:
+            self.fail(e)
+        finally:
+            if source is not None:
+                source.close()
+            try:
+                self.save(force=True)
+            except OSError as e:
+                self.fail(e)
+
+    def start(self):
+        """Run the watcher on a daemon thread"""
+        self.thread = threading.Thread(target=self.run, daemon=True, name="folder-watcher")
+        self.thread.start()
+
+    def stop(self, wait=True):
+        """Stop watching, saving the index"""
+        self.stop_event.set()
+        if wait and self.thread is not None:
+            self.thread.join()